@@ -0,0 +1,430 @@
+"""
+Benchmark загрузчика
+====================
+Замер скорости YouTubeDownloader на локальном тестовом сервере, чтобы
+сравнивать изменения в download_youtube_folder.py между коммитами
+
+Тестовый сервер запускается в отдельном процессе и отдаёт синтетические
+прогрессивные файлы или DASH (отдельные видео и аудио + манифест .mpd)
+с настраиваемой задержкой, ограничением скорости и долей обрывов
+соединения. Результат (пропускная способность, время этапов, пиковая
+память, процессорное время на ГБ) выводится и сохраняется в JSON.
+
+Сценарий startup замеряет время запуска отдельных процессов: импорт
+модуля, --help обоих скриптов и загрузку каждого URL отдельным запуском
+download_youtube_cli.py (как у скриптов-обёрток, вызывающих загрузчик
+на каждый URL).
+
+Для режима dash нужен ffmpeg (генерация медиа и слияние потоков).
+
+Примеры использования:
+  python benchmark_download.py --files 10 --size 20 --jobs 4
+  python benchmark_download.py --mode dash --pipeline parallel --output after.json
+  python benchmark_download.py --latency 50 --bandwidth 5 --failure-rate 0.1
+  python benchmark_download.py --output after.json --compare before.json
+  python benchmark_download.py --scenario startup --files 10 --size 1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from download_youtube_folder import YouTubeDownloader, ProgressReporter
+
+
+HERE = Path(__file__).resolve().parent
+
+
+MPD_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S"
+     minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">
+ <Period>
+  <AdaptationSet mimeType="video/mp4" contentType="video">
+   <Representation id="video" codecs="avc1.64001f" bandwidth="{video_bandwidth}" width="1280" height="720">
+    <BaseURL>{index}/video.mp4</BaseURL>
+   </Representation>
+  </AdaptationSet>
+  <AdaptationSet mimeType="audio/mp4" contentType="audio" lang="en">
+   <Representation id="audio" codecs="mp4a.40.2" bandwidth="128000" audioSamplingRate="44100">
+    <BaseURL>{index}/audio.m4a</BaseURL>
+   </Representation>
+  </AdaptationSet>
+ </Period>
+</MPD>
+"""
+
+
+class MockVideoHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик тестового сервера
+
+    /progressive/<N>.mp4        - один файл с видео
+    /dash/<N>.mpd               - DASH-манифест
+    /dash/<N>/video.mp4, audio.m4a - потоки для слияния
+    """
+
+    protocol_version = 'HTTP/1.1'
+    root = ''
+    latency = 0.0
+    bandwidth = 0.0
+    failure_rate = 0.0
+    duration = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_empty(self, code: int) -> None:
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split('?')[0]
+
+        match = re.fullmatch(r'/dash/(\d+)\.mpd', path)
+        if match:
+            video_size = os.path.getsize(os.path.join(self.root, 'video.mp4'))
+            body = MPD_TEMPLATE.format(
+                duration=self.duration, index=match.group(1),
+                video_bandwidth=video_size * 8 // max(1, self.duration)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/dash+xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if re.fullmatch(r'/progressive/\d+\.mp4|/dash/\d+/video\.mp4', path):
+            filename = 'video.mp4'
+        elif re.fullmatch(r'/dash/\d+/audio\.m4a', path):
+            filename = 'audio.m4a'
+        else:
+            self._send_empty(404)
+            return
+        self._send_media(os.path.join(self.root, filename))
+
+    def _send_media(self, filename: str) -> None:
+        size = os.path.getsize(filename)
+        start, end = 0, size - 1
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start > end:
+                self._send_empty(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        # Обрыв соединения в случайном месте ответа
+        cut = None
+        if end > start and random.random() < self.failure_rate:
+            cut = random.randint(start, end)
+
+        chunk = 64 * 1024
+        started = time.monotonic()
+        sent = 0
+        with open(filename, 'rb') as file:
+            file.seek(start)
+            pos = start
+            while pos <= end:
+                data = file.read(min(chunk, end - pos + 1))
+                if cut is not None and pos + len(data) > cut:
+                    self.wfile.write(data[:cut - pos])
+                    self.close_connection = True
+                    return
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                pos += len(data)
+                sent += len(data)
+                if self.bandwidth:
+                    # Ограничение скорости на одно соединение
+                    delay = sent / self.bandwidth - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+
+def run_mock_host(root: str, latency: float, bandwidth: float, failure_rate: float,
+                  duration: int, port_queue) -> None:
+    """Запуск тестового сервера (в отдельном процессе)"""
+    MockVideoHandler.root = root
+    MockVideoHandler.latency = latency
+    MockVideoHandler.bandwidth = bandwidth
+    MockVideoHandler.failure_rate = failure_rate
+    MockVideoHandler.duration = duration
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockVideoHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def generate_media(root: str, mode: str, size_mb: float, ffmpeg: Optional[str]) -> int:
+    """
+    Создание синтетических медиафайлов
+
+    Returns:
+        Длительность видео в секундах (для манифеста)
+    """
+    video = os.path.join(root, 'video.mp4')
+    if mode == 'progressive':
+        with open(video, 'wb') as file:
+            for _ in range(int(size_mb)):
+                file.write(os.urandom(1024 * 1024))
+            file.write(os.urandom(int((size_mb % 1) * 1024 * 1024)))
+        return 0
+
+    # Шум плохо сжимается: размер определяется битрейтом и длительностью
+    duration = 10
+    bitrate = int(size_mb * 8 * 1024 * 1024 / duration)
+    subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-f', 'lavfi',
+                    '-i', f'nullsrc=s=1280x720:d={duration},geq=random(1)*255:128:128',
+                    '-c:v', 'mpeg4', '-b:v', str(bitrate), '-maxrate', str(bitrate),
+                    '-bufsize', str(bitrate), video], check=True)
+    subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-f', 'lavfi',
+                    '-i', f'sine=duration={duration}', '-c:a', 'aac',
+                    os.path.join(root, 'audio.m4a')], check=True)
+    return duration
+
+
+def _cpu_seconds() -> Optional[float]:
+    """Процессорное время процесса и его дочерних процессов (ffmpeg)"""
+    if resource is None:
+        return None
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает КБ, macOS - байты
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _timed_run(cmd: list, cwd: str) -> float:
+    """Время выполнения команды в отдельном процессе, с"""
+    started = time.perf_counter()
+    subprocess.run(cmd, cwd=cwd, stdin=subprocess.DEVNULL,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def run_startup(urls: list, work: str, events_path: str, repeat: int = 5) -> dict:
+    """
+    Время запуска: медианы импорта модуля, --help и загрузки одного URL
+    отдельным процессом download_youtube_cli.py
+    """
+    python = sys.executable
+    output_dir = os.path.join(work, 'cli')
+    os.makedirs(output_dir)
+    commands = {
+        'import_seconds': [python, '-c', 'import download_youtube_folder'],
+        'help_script_seconds': [python, str(HERE / 'download_youtube_folder.py'), '--help'],
+        'help_cli_seconds': [python, str(HERE / 'download_youtube_cli.py'), '--help'],
+    }
+    # Первый запуск записывает __pycache__ и кэш ffmpeg - в замер не входит
+    _timed_run(commands['help_cli_seconds'], str(HERE))
+    startup = {name: round(statistics.median(_timed_run(cmd, str(HERE)) for _ in range(repeat)), 3)
+               for name, cmd in commands.items()}
+    per_url = [_timed_run([python, str(HERE / 'download_youtube_cli.py'), url, '--no-cache',
+                           '--no-archive', '--progress-json', events_path], output_dir)
+               for url in urls]
+    startup['per_url_seconds'] = round(statistics.median(per_url), 3)
+    return startup
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _phase_timings(events_path: str) -> dict:
+    """Суммарное время этапов по событиям 'done' ProgressReporter"""
+    phases = {'extract': 0.0, 'fetch': 0.0, 'merge': 0.0, 'postprocess': 0.0}
+    with open(events_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            event = json.loads(line)
+            if event['event'] != 'done':
+                continue
+            for phase, value in (event.get('timings') or {}).items():
+                if phase in phases:
+                    phases[phase] += value
+    return {name: round(value, 3) for name, value in phases.items()}
+
+
+def run_benchmark(args) -> dict:
+    ffmpeg = shutil.which('ffmpeg')
+    if args.mode == 'dash' and not ffmpeg:
+        raise SystemExit("❌ Для режима dash нужен ffmpeg")
+
+    work = tempfile.mkdtemp(prefix='yt_bench_')
+    media = os.path.join(work, 'media')
+    os.makedirs(media)
+    duration = generate_media(media, args.mode, args.size, ffmpeg)
+
+    port_queue = multiprocessing.Queue()
+    host = multiprocessing.Process(
+        target=run_mock_host, daemon=True,
+        args=(media, args.latency / 1000, args.bandwidth * 1024 * 1024,
+              args.failure_rate, duration, port_queue))
+    host.start()
+    try:
+        port = port_queue.get(timeout=10)
+        suffix = 'mpd' if args.mode == 'dash' else 'mp4'
+        urls = [f'http://127.0.0.1:{port}/{args.mode}/{i}.{suffix}' for i in range(args.files)]
+        list_path = os.path.join(work, 'urls.txt')
+        with open(list_path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(urls) + '\n')
+
+        events_path = os.path.join(work, 'events.jsonl')
+        downloader = YouTubeDownloader(connections=args.connections, pipeline=args.pipeline,
+                                       progress=ProgressReporter(events_path=events_path))
+
+        cpu_before = _cpu_seconds()
+        started = time.perf_counter()
+        startup = None
+        if args.scenario == 'startup':
+            startup = run_startup(urls, work, events_path)
+            errors = args.files - len(os.listdir(os.path.join(work, 'cli')))
+        elif args.scenario == 'batch':
+            stats = downloader.download_from_file(list_path, jobs=args.jobs, rate_limit=0)
+            errors = stats['errors']
+        else:
+            output_dir = os.path.join(work, 'single')
+            errors = sum(1 for url in urls if not downloader.download_video(url, output_dir))
+        wall = time.perf_counter() - started
+        cpu_after = _cpu_seconds()
+        downloader.close_sessions()
+        downloader.progress.stop()
+
+        downloaded = sum(f.stat().st_size for f in Path(work).glob('*/*')
+                         if f.is_file() and f.parent.name != 'media')
+        gigabytes = downloaded / 1024 ** 3
+        cpu = cpu_after - cpu_before if cpu_before is not None else None
+        report = {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'files': args.files,
+            'errors': errors,
+            'bytes': downloaded,
+            'wall_seconds': round(wall, 3),
+            'throughput_mb_s': round(downloaded / 1024 ** 2 / wall, 2) if wall else None,
+            'phases': _phase_timings(events_path),
+            'peak_rss_mb': round(_peak_rss_mb(), 1) if resource else None,
+            'cpu_seconds': round(cpu, 3) if cpu is not None else None,
+            'cpu_seconds_per_gb': round(cpu / gigabytes, 2) if cpu is not None and gigabytes else None,
+        }
+        if startup:
+            report['startup'] = startup
+        return report
+    finally:
+        host.terminate()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    """Вывод результатов; при наличии baseline - с изменением в процентах"""
+    def delta(value, old):
+        if baseline is None or not isinstance(value, (int, float)) or not old:
+            return ''
+        return f"  ({(value - old) / old * 100:+.1f}%)"
+
+    old = baseline or {}
+    print("\n" + "=" * 60)
+    print(f"📊 BENCHMARK (коммит {report['commit'] or '?'})")
+    if baseline:
+        print(f"   сравнение с {baseline.get('commit') or '?'} от {baseline.get('timestamp')}")
+    for key, title in (('wall_seconds', '⏱️  Общее время, с'),
+                       ('throughput_mb_s', '🚀 Скорость, МБ/с'),
+                       ('peak_rss_mb', '🧠 Пиковая память, МБ'),
+                       ('cpu_seconds_per_gb', '⚙️  Процессор, с/ГБ')):
+        print(f"{title}: {report[key]}{delta(report[key], old.get(key))}")
+    print(f"📦 Скачано: {report['bytes'] / 1024 ** 2:.1f} МБ")
+    print(f"❌ Ошибок: {report['errors']} из {report['files']}")
+    for phase, value in report['phases'].items():
+        print(f"   {phase:<12} {value:8.3f} с{delta(value, (old.get('phases') or {}).get(phase))}")
+    if report.get('startup'):
+        print("🏁 Запуск (медиана), с:")
+        for key, title in (('import_seconds', 'импорт модуля'),
+                           ('help_script_seconds', '--help скрипта'),
+                           ('help_cli_seconds', '--help быстрого входа'),
+                           ('per_url_seconds', 'один URL процессом')):
+            value = report['startup'][key]
+            print(f"   {title:<22} {value:8.3f}{delta(value, (old.get('startup') or {}).get(key))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark загрузчика на локальном тестовом сервере",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('Примеры использования:')[1],
+    )
+    parser.add_argument('--mode', choices=['progressive', 'dash'], default='progressive',
+                        help='Тип форматов: один файл или видео+аудио со слиянием')
+    parser.add_argument('--scenario', choices=['batch', 'single', 'startup'], default='batch',
+                        help='download_from_file, download_video по очереди или '
+                             'время запуска (отдельный процесс на каждый URL)')
+    parser.add_argument('--files', type=int, default=5, help='Количество видео')
+    parser.add_argument('--size', type=float, default=10, help='Размер видео, МБ')
+    parser.add_argument('--latency', type=float, default=0, help='Задержка ответа сервера, мс')
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='Ограничение скорости на соединение, МБ/с (0 - без ограничения)')
+    parser.add_argument('--failure-rate', type=float, default=0,
+                        help='Доля ответов с обрывом соединения (0..1)')
+    parser.add_argument('--jobs', type=int, default=1, help='Одновременных загрузок')
+    parser.add_argument('--connections', type=int, default=1, help='Соединений на файл')
+    parser.add_argument('--pipeline', choices=['off', 'parallel', 'stream'], default='off',
+                        help='Режим загрузки потоков для слияния')
+    parser.add_argument('--output', '-o', type=str, help='Сохранить результат в JSON')
+    parser.add_argument('--compare', type=str, help='JSON предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результат сохранён: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
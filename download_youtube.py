@@ -20,15 +20,20 @@ def download_video(video_url):
 
 def download_from_file(file_path):
     try:
+        # Файл читается построчно: скачивание начинается сразу, без загрузки всего списка
+        count = 0
         with open(file_path, 'r', encoding='utf-8') as file:
-            urls = [line.strip() for line in file if line.strip()]
-        if not urls:
+            for line in file:
+                url = line.strip()
+                if not url:
+                    continue
+                count += 1
+                print(f"\nСкачивание {count}: {url}")
+                download_video(url)
+        if not count:
             print("Файл пуст или содержит только пустые строки.")
             return
-        print(f"Найдено {len(urls)} URL-адресов для скачивания.")
-        for i, url in enumerate(urls, 1):
-            print(f"\nСкачивание {i}/{len(urls)}: {url}")
-            download_video(url)
+        print(f"\nОбработано {count} URL-адресов.")
     except FileNotFoundError:
         print(f"Файл {file_path} не найден.")
     except Exception as e:
@@ -0,0 +1,31 @@
+"""
+Быстрый запуск загрузчика
+=========================
+Те же аргументы командной строки, что и у download_youtube_folder.py, но
+с меньшим временем запуска - для скриптов, которые вызывают загрузчик
+отдельно на каждый URL:
+
+- основной модуль импортируется, а не запускается как скрипт, поэтому
+  Python берёт готовый байт-код из __pycache__, а не компилирует весь
+  файл при каждом запуске;
+- yt-dlp импортируется только когда нужен (справка и ошибки в аргументах
+  обходятся без него), и регистрируются только экстракторы нужных сайтов;
+- путь к ffmpeg и результат проверки его версии берутся из кэша
+  ~/.youtube_downloader/ffmpeg.json.
+
+Замер времени запуска:
+  python benchmark_download.py --scenario startup
+
+Примеры использования:
+  python download_youtube_cli.py "https://www.youtube.com/watch?v=..." --audio-only
+  python download_youtube_cli.py --file urls.txt --jobs 4
+"""
+
+from download_youtube_folder import main
+
+
+if __name__ == "__main__":
+    # Процессы постобработки в собранном exe (PyInstaller) запускают этот же файл
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
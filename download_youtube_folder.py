@@ -13,128 +13,2951 @@ YouTube Video Downloader
 - pip install --upgrade pyinstaller
 """
 
-import yt_dlp
+from __future__ import annotations
+
 import sys
 import os
 import argparse
+import functools
+import glob
+import hashlib
+import heapq
+import importlib
+import itertools
+import json
+import pickle
+import random
+import re
 import shutil
-from datetime import datetime
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple, Iterable, Iterator, TextIO
+from urllib.parse import urlparse, urlunparse, urlencode, parse_qs, parse_qsl
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class LazyModule:
+    """
+    Модуль, импортируемый при первом обращении к его атрибутам
+    
+    Импорт yt-dlp загружает сотни модулей и занимает заметную часть
+    запуска; разбор аргументов, справка и ошибки в них обходятся без него.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+    
+    def __getattr__(self, attr: str):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+yt_dlp = LazyModule('yt_dlp')
+
+# Шаблоны имени файла: обычный и с ID видео для разрешения совпадений названий
+OUTTMPL = '%(title)s.%(ext)s'
+OUTTMPL_UNIQUE = '%(title)s [%(id)s].%(ext)s'
+
+# Допустимые значения качества видео
+QUALITIES = ('best', 'worst', '144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p')
+
+# Папка для служебных файлов (кэш метаданных и т.п.)
+DATA_DIR = Path.home() / '.youtube_downloader'
+
+
+# Флаги в начале _VALID_URL, например (?x) или (?i)
+_PATTERN_FLAGS_RE = re.compile(r'\(\?([aiLmsux]+)\)')
+# Схема в начале _VALID_URL; за ней до первого '/' - шаблон хоста
+_URL_SCHEME_RE = re.compile(r'(https\?|https|http|\(\?:https\?\))://')
+# Начало _VALID_URL без спецсимволов (например ':ytfav' или 'ytsearch')
+_LITERAL_PREFIX_RE = re.compile(r'([^\\.^$*+?{}\[\]|()]*)([?*{]?)')
+# Экранирование или класс символов целиком
+_ESCAPE_OR_CLASS = r'\\.|\[\^?\]?(?:\\.|[^\]\\])*\]?'
+# Пробелы и комментарии режима (?x); экранирования и классы сохраняются
+_VERBOSE_NOISE_RE = re.compile(rf'({_ESCAPE_OR_CLASS})|#[^\n]*|\s+', re.DOTALL)
+# Скобки и '|' вне экранирований и классов
+_PATTERN_TOKEN_RE = re.compile(rf'{_ESCAPE_OR_CLASS}|[()|]', re.DOTALL)
+# Экранирования в шаблоне хоста, которые не совпадают с '/'
+_HOST_ESCAPES = ('.', '-', 'd', 'w')
+# Шаблоны хостов экстракторов (см. _extractor_hosts)
+_EXTRACTOR_HOSTS: Dict[type, Optional[list]] = {}
+# Скомпилированные _VALID_URL экстракторов (см. _suitable)
+_EXTRACTOR_REGEXES: Dict[type, Optional[tuple]] = {}
+# Хост URL -> [экстракторы, которые могут ему подойти, сколько экстракторов уже разобрано]
+_HOST_SCANS: Dict[tuple, list] = {}
+HOST_SCANS_LIMIT = 4096
+_host_scans_lock = threading.Lock()
+
+
+def _class_end(pattern: str, start: int) -> int:
+    """Индекс ']', закрывающего класс символов, который начинается в start"""
+    i = start + 1
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':
+        i += 1
+    while i < len(pattern) and pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i
+
+
+def _strip_verbose(pattern: str) -> str:
+    """Шаблон режима (?x) без пробелов и комментариев"""
+    return _VERBOSE_NOISE_RE.sub(lambda match: match.group(1) or '', pattern)
+
+
+def _has_alternation(pattern: str) -> bool:
+    """Есть ли в шаблоне '|' вне групп"""
+    depth = 0
+    for match in _PATTERN_TOKEN_RE.finditer(pattern):
+        token = match.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif token == '|' and depth <= 0:
+            return True
+    return False
+
+
+def _literal_prefix(pattern: str, ignore_case: bool):
+    """
+    Проверка по буквальному началу _VALID_URL: f(схема, хост) -> может ли
+    шаблон подойти URL вида схема://хост/...; None - начала нет
+    """
+    match = _LITERAL_PREFIX_RE.match(pattern)
+    # Символ перед ?, * или {n,m} может отсутствовать
+    literal = match.group(1)[:-1] if match.group(2) else match.group(1)
+    # Альтернатива может начинаться иначе
+    if not literal or _has_alternation(pattern):
+        return None
+    if ignore_case:
+        literal = literal.lower()
+    
+    def can_match(scheme: str, host: str) -> bool:
+        start = f'{scheme}://{host}/'
+        if ignore_case:
+            start = start.lower()
+        return start.startswith(literal) or literal.startswith(start)
+    return can_match
+
+
+def _host_pattern(pattern: str):
+    """
+    Проверка _VALID_URL экстрактора по схеме и хосту URL: f(схема, хост)
+    -> может ли шаблон подойти URL вида схема://хост/...
+    
+    Выделяется часть между '://' и первым '/' верхнего уровня, если она не
+    может совпасть с '/' (нет '.', '\\S', [^...] без '/' и т.п.), а в шаблоне
+    нет альтернатив верхнего уровня - тогда экстрактор подходит только URL
+    с совпадающим хостом. Шаблоны не для http(s) (например ':ytfav')
+    отсекаются по буквальному началу. None - шаблон сложнее, экстрактор
+    проверяется всегда.
+    """
+    flags = _PATTERN_FLAGS_RE.match(pattern)
+    if flags:
+        pattern = pattern[flags.end():]
+        if 'x' in flags.group(1):
+            pattern = _strip_verbose(pattern)
+    ignore_case = bool(flags) and 'i' in flags.group(1)
+    match = _URL_SCHEME_RE.match(pattern)
+    if not match:
+        return _literal_prefix(pattern, ignore_case)
+    depth, host_end, i = 0, None, match.end()
+    while host_end is None and i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if pattern[i + 1:i + 2] not in _HOST_ESCAPES:
+                return None
+            i += 1
+        elif char == '[':
+            end = _class_end(pattern, i)
+            # [^...] совпадает с '/', если '/' нет среди исключённых символов
+            if pattern[i + 1:i + 2] == '^':
+                if '/' not in pattern[i + 2:end]:
+                    return None
+            elif '/' in pattern[i + 1:end] or '\\' in pattern[i + 1:end].replace('\\w', '').replace('\\d', ''):
+                return None
+            i = end
+        elif char == '(':
+            # Просмотр назад видит схему, которой нет в проверяемом хосте
+            if pattern.startswith(('(?<=', '(?<!'), i):
+                return None
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '.' or char == '/' and depth:
+            return None
+        elif char == '/':
+            host_end = i
+        i += 1
+    if host_end is None or _has_alternation(pattern):
+        return None
+    try:
+        host = re.compile(pattern[match.end():host_end], re.IGNORECASE if ignore_case else 0)
+    except re.error:
+        return None
+    schemes = (match.group(1),) if match.group(1) in ('http', 'https') else ('http', 'https')
+    return lambda scheme, netloc: scheme in schemes and host.fullmatch(netloc) is not None
+
+
+def _default_matching(ie) -> bool:
+    """Экстрактор проверяет URL только по _VALID_URL (без своего suitable)"""
+    for klass in ie.__mro__:
+        if klass.__name__ in ('LazyLoadExtractor', 'InfoExtractor'):
+            return True
+        if 'suitable' in vars(klass) or '_match_valid_url' in vars(klass):
+            return False
+    return False
+
+
+def _valid_urls(ie) -> Optional[list]:
+    """
+    Шаблоны _VALID_URL экстрактора; None - шаблонов нет
+    
+    Свой suitable в экстракторах yt-dlp только сужает _VALID_URL (отказ от
+    URL плейлистов или других экстракторов того же сайта), поэтому URL,
+    не подходящий ни одному шаблону, не подходит и такому экстрактору.
+    """
+    patterns = ie._VALID_URL
+    if patterns is False:
+        return []
+    patterns = patterns if isinstance(patterns, (list, tuple)) else [patterns]
+    return patterns if all(isinstance(pattern, str) for pattern in patterns) else None
+
+
+def _extractor_hosts(ie) -> Optional[list]:
+    """Проверки всех _VALID_URL экстрактора (см. _host_pattern); None - его нужно проверять для любого URL"""
+    if ie not in _EXTRACTOR_HOSTS:
+        patterns = _valid_urls(ie)
+        hosts = None if patterns is None else [_host_pattern(pattern) for pattern in patterns]
+        _EXTRACTOR_HOSTS[ie] = None if hosts is None or None in hosts else hosts
+    return _EXTRACTOR_HOSTS[ie]
+
+
+def _suitable(ie, url: str) -> bool:
+    """
+    ie.suitable(url); _VALID_URL компилируются здесь при первой проверке и
+    сверяются напрямую - в разы быстрее suitable ленивых экстракторов.
+    Свой suitable вызывается, только если URL подошёл шаблону.
+    """
+    if ie not in _EXTRACTOR_REGEXES:
+        patterns = _valid_urls(ie)
+        _EXTRACTOR_REGEXES[ie] = None if patterns is None else (
+            tuple(re.compile(pattern) for pattern in patterns), _default_matching(ie))
+    if _EXTRACTOR_REGEXES[ie] is None:
+        return ie.suitable(url)
+    regexes, default_matching = _EXTRACTOR_REGEXES[ie]
+    if not any(regex.match(url) for regex in regexes):
+        return False
+    return default_matching or ie.suitable(url)
+
+
+@functools.lru_cache(maxsize=None)
+def _all_extractors() -> tuple:
+    """Экстракторы yt-dlp (кроме Generic) в порядке проверки YoutubeDL.extract_info"""
+    return tuple(ie for ie in yt_dlp.extractor.gen_extractor_classes() if ie.ie_key() != 'Generic')
+
+
+@functools.lru_cache(maxsize=4096)
+def url_extractor(url: str):
+    """
+    Экстрактор yt-dlp для URL без обращения к сети
+    
+    Экстракторы проверяются в том же порядке, что и в YoutubeDL.extract_info;
+    None - подходит только Generic. Для обычных http(s)-URL запоминаются
+    по хосту экстракторы, шаблон хоста которых может с ним совпасть, и
+    дальше проверяются только они: полный перебор для каждого URL длинного
+    списка прямых ссылок занимал бы миллисекунды на URL. Список хоста
+    достраивается по мере перебора, поэтому для первого URL YouTube
+    разбираются шаблоны лишь нескольких экстракторов.
+    """
+    scheme, _, rest = url.partition('://')
+    if scheme not in ('http', 'https') or '/' not in rest:
+        return next((ie for ie in _all_extractors() if _suitable(ie, url)), None)
+    host = (scheme, rest.split('/', 1)[0])
+    with _host_scans_lock:
+        scan = _HOST_SCANS.get(host)
+        if scan is None:
+            # Кэш ограничен: вытесняется самый старый хост
+            if len(_HOST_SCANS) >= HOST_SCANS_LIMIT:
+                del _HOST_SCANS[next(iter(_HOST_SCANS))]
+            scan = _HOST_SCANS[host] = [[], 0]
+        candidates = scan[0]
+        for ie in candidates:
+            if _suitable(ie, url):
+                return ie
+        extractors = _all_extractors()
+        while scan[1] < len(extractors):
+            ie = extractors[scan[1]]
+            scan[1] += 1
+            hosts = _extractor_hosts(ie)
+            if hosts is None or any(can_match(*host) for can_match in hosts):
+                candidates.append(ie)
+                if _suitable(ie, url):
+                    return ie
+    return None
+
+
+def video_key(url: str) -> Optional[str]:
+    """
+    Ключ видео '<экстрактор>:<ID>' по URL без обращения к сети
+    
+    Возвращает None, если ID нельзя определить по самому URL (generic-ссылки,
+    плейлисты и каналы) - такие URL не кэшируются.
+    """
+    if 'list' in parse_qs(urlparse(url).query):
+        return None
+    ie = url_extractor(url)
+    video_id = ie.get_temp_id(url) if ie else None
+    return f"{ie.ie_key()}:{video_id}" if video_id else None
+
+
+def is_playlist_url(url: str) -> bool:
+    """
+    Похож ли URL на плейлист или канал (проверка без обращения к сети)
+
+    Плейлистом считается ссылка с параметром list= и ссылка известного
+    сайта, экстрактор которой не обязательно возвращает одно видео
+    (каналы, вкладки, подборки). Прямые ссылки на файлы - не плейлисты.
+    """
+    if 'list' in parse_qs(urlparse(url).query):
+        return True
+    ie = url_extractor(url)
+    return ie is not None and ie.is_single_video(url) is not True
+
+
+# Параметры, задающие лишь контекст плейлиста у ссылки на конкретное видео
+PLAYLIST_CONTEXT_PARAMS = ('list', 'index', 'pp', 'start_radio', 'playnext')
+
+
+def normalize_url(url: str) -> Tuple[str, str]:
+    """
+    Каноническая форма URL без обращения к сети
+
+    Ссылка на видео в контексте плейлиста (watch?v=...&list=...) сводится
+    к ссылке на само видео. Ключ - '<экстрактор>:<ID>', если его можно
+    определить по URL (youtu.be, m.youtube.com, &t= и т.п. дают один ключ),
+    иначе - сам URL без якоря и с хостом в нижнем регистре.
+
+    Returns:
+        (URL для загрузки, ключ для поиска дубликатов)
+    """
+    url = url.strip()
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    if any(name == 'list' for name, _ in query):
+        single = urlunparse(parsed._replace(query=urlencode(
+            [(name, value) for name, value in query if name not in PLAYLIST_CONTEXT_PARAMS])))
+        if video_key(single) and not is_playlist_url(single):
+            url, parsed = single, urlparse(single)
+    key = video_key(url)
+    if key:
+        return url, key
+    return url, urlunparse(parsed._replace(scheme=parsed.scheme.lower(),
+                                           netloc=parsed.netloc.lower(), fragment=''))
+
+
+@dataclass
+class DownloadResult:
+    """Результат загрузки одного URL"""
+    url: str
+    success: bool = False
+    info: Optional[dict] = None
+    formats: List[str] = field(default_factory=list)
+    filepath: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    from_cache: bool = False
+    skipped: bool = False
+    session_reused: bool = False
+    bytes: int = 0
+    retries: int = 0
+    # Класс ошибки (см. classify_error), если загрузка не удалась
+    error_class: Optional[str] = None
+    # Завершается после постобработки в пуле процессов (см. PostprocessPool)
+    pending: Optional[Future] = None
+    # Извлечение аудио: 'copy' - без перекодирования, 'transcode' - с ним
+    audio_path: Optional[str] = None
+    # Длительность извлечённого аудио, с
+    audio_duration: float = 0.0
+    # Ключ видео для архива, хранилища и имён файлов (см. _info_key)
+    key: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+@dataclass
+class EntryFilter:
+    """
+    Отбор видео плейлиста по данным из списка, до извлечения каждого видео
+
+    Проверяются только поля, известные из страницы плейлиста; если поле
+    отсутствует, видео не отбрасывается.
+    """
+    dates: Optional[yt_dlp.utils.DateRange] = None
+    min_duration: Optional[float] = None
+    max_duration: Optional[float] = None
+    # Позиции в плейлисте (с 1, включительно); None - без ограничения
+    first: int = 1
+    last: Optional[int] = None
+
+    @staticmethod
+    def parse_items(text: str) -> Tuple[int, Optional[int]]:
+        """Разбор диапазона позиций вида '10-50', '10-' или '25'"""
+        start, sep, end = text.partition('-')
+        first = int(start) if start.strip() else 1
+        last = (int(end) if end.strip() else None) if sep else first
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f'некорректный диапазон: {text}')
+        return first, last
+
+    @staticmethod
+    def _entry_date(entry: dict) -> Optional[str]:
+        if entry.get('upload_date'):
+            return entry['upload_date']
+        timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+        if timestamp:
+            return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+        return None
+
+    def rejects(self, entry: dict) -> Optional[str]:
+        """Причина отбрасывания видео или None, если оно подходит"""
+        date = self._entry_date(entry)
+        if self.dates and date and date not in self.dates:
+            return f'дата {date} вне диапазона {self.dates}'
+        duration = entry.get('duration')
+        if duration is not None:
+            if self.min_duration is not None and duration < self.min_duration:
+                return f'длительность {duration:.0f} с меньше {self.min_duration:.0f} с'
+            if self.max_duration is not None and duration > self.max_duration:
+                return f'длительность {duration:.0f} с больше {self.max_duration:.0f} с'
+        return None
+
+
+def _url_from_line(line: str) -> Optional[str]:
+    """URL из строки списка: обычная строка или запись JSON (файл неудач)"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        try:
+            return json.loads(line).get('url') or None
+        except (ValueError, AttributeError):
+            return None
+    return line
+
+
+def read_urls(source: str, follow: bool = False,
+              idle_timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Построчное чтение URL из файла или stdin ('-') без загрузки целиком
+
+    Пустые строки и комментарии (#) пропускаются; из строк JSON (файл
+    неудачных загрузок) берётся поле url. С follow=True файл
+    читается как в `tail -f`: после конца файла ожидаются новые строки,
+    пока они не перестанут появляться в течение idle_timeout секунд
+    (None - без ограничения, до Ctrl+C). Недописанная последняя строка
+    выдаётся только после появления перевода строки.
+    """
+    file = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        pending = ''
+        last_data = time.monotonic()
+        while True:
+            line = file.readline()
+            if line:
+                last_data = time.monotonic()
+                if follow and not line.endswith('\n'):
+                    pending += line
+                    continue
+                line, pending = pending + line, ''
+                url = _url_from_line(line)
+                if url:
+                    yield url
+                continue
+            if not follow or file is sys.stdin:
+                break
+            if idle_timeout is not None and time.monotonic() - last_data > idle_timeout:
+                break
+            time.sleep(0.5)
+        url = _url_from_line(pending)
+        if url:
+            yield url
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+class UrlDeduplicator:
+    """
+    Потоковое удаление повторов URL по каноническому ключу
+
+    Хранятся только 64-битные хэши ключей, поэтому память растёт примерно
+    на 80 байт на уникальный URL, а сами списки не загружаются целиком.
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self.collapsed = 0
+
+    def __call__(self, urls: Iterable[str]) -> Iterator[str]:
+        for url in urls:
+            url, key = normalize_url(url)
+            digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+            if digest in self._seen:
+                self.collapsed += 1
+                continue
+            self._seen.add(digest)
+            yield url
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов (token bucket) отдельно для каждого хоста
+    
+    Пока в корзине есть токены, запросы проходят без задержки; пауза
+    возникает только когда запросы к одному хосту идут чаще, чем rate.
+    """
+    
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Запросов в секунду на хост (0 - без ограничения)
+            burst: Сколько запросов подряд можно сделать без паузы
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, url: str) -> float:
+        """Получение токена для хоста URL; возвращает время ожидания в секундах"""
+        if self.rate <= 0:
+            return 0.0
+        host = urlparse(url).hostname or ''
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (float(self.burst), now))
+                tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return waited
+                self._buckets[host] = (tokens, now)
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def human_size(num: Optional[float]) -> str:
+    """Размер в байтах в читаемом виде"""
+    if num is None:
+        return '?'
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} ТБ"
+
+
+def parse_size(text: str) -> int:
+    """Размер из строки вида '500M', '1.5G', '800MB' или числа байт"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*', text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f'некорректный размер: {text}')
+    power = ' KMGT'.index(match.group(2).upper() or ' ')
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+class _ProgressConsole:
+    """
+    Обёртка над stdout: перед выводом любого текста стирает блок прогресса,
+    чтобы обычные сообщения не перемешивались со сводкой загрузок
+    """
+    
+    def __init__(self, reporter: 'ProgressReporter', stream: TextIO):
+        self._reporter = reporter
+        self._stream = stream
+    
+    def write(self, text: str) -> int:
+        with self._reporter._lock:
+            self._reporter._erase()
+            if text:
+                self._reporter._line_open = not text.endswith('\n')
+            return self._stream.write(text)
+    
+    def __getattr__(self, name):
+        # Без buffer: yt-dlp иначе пишет байты в обход обёртки
+        if name == 'buffer':
+            raise AttributeError(name)
+        return getattr(self._stream, name)
+
+
+class ProgressReporter:
+    """
+    Прогресс загрузок с ограничением частоты отрисовки
+    
+    Обновления от progress hooks лишь запоминаются; экран перерисовывается
+    не чаще interval секунд одним блоком со строкой на каждую активную
+    загрузку. Дополнительно события можно писать в JSON lines (по объекту
+    на строку: время, событие, этап, байты, скорость, ETA) для мониторинга.
+    """
+    
+    def __init__(self, interval: float = 0.1, events_path: Optional[str] = None):
+        """
+        Args:
+            interval: Минимальный интервал между перерисовками, секунды
+            events_path: Файл для JSON lines событий ('-' - stderr)
+        """
+        self.interval = interval
+        self._active: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self._last_render = 0.0
+        self._drawn = 0
+        self._line_open = False
+        self._stdout: Optional[TextIO] = None
+        self._events: Optional[TextIO] = None
+        if events_path == '-':
+            self._events = sys.stderr
+        elif events_path:
+            self._events = open(events_path, 'a', encoding='utf-8')
+    
+    def start(self) -> None:
+        """Перехват stdout для многострочного вывода (только в терминале)"""
+        if self._stdout is None and sys.stdout.isatty():
+            if os.name == 'nt':
+                os.system('')  # Включает ANSI-последовательности в консоли Windows
+            self._stdout = sys.stdout
+            sys.stdout = _ProgressConsole(self, self._stdout)
+    
+    def stop(self) -> None:
+        with self._lock:
+            self._erase()
+            if self._stdout is not None:
+                sys.stdout = self._stdout
+                self._stdout = None
+            if self._events is not None and self._events is not sys.stderr:
+                self._events.close()
+            self._events = None
+    
+    def event(self, event: str, **fields) -> None:
+        """Запись события в поток JSON lines"""
+        if self._events is None:
+            return
+        record = {'ts': round(time.time(), 3), 'event': event}
+        record.update((k, v) for k, v in fields.items() if v is not None)
+        with self._lock:
+            self._events.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._events.flush()
+    
+    def hook(self, d: dict) -> None:
+        """Progress hook для yt-dlp"""
+        name = d.get('filename') or d.get('tmpfilename') or ''
+        info = d.get('info_dict') or {}
+        with self._lock:
+            if d['status'] == 'downloading':
+                self._active[name] = {
+                    'url': info.get('webpage_url'),
+                    'format_id': info.get('format_id'),
+                    'downloaded_bytes': d.get('downloaded_bytes') or 0,
+                    'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                    'speed': d.get('speed'),
+                    'eta': d.get('eta'),
+                }
+                now = time.monotonic()
+                if now - self._last_render < self.interval:
+                    return
+                self._last_render = now
+                for file, state in self._active.items():
+                    self.event('progress', phase='download', file=file, **state)
+                self._render()
+            else:
+                self._active.pop(name, None)
+                self.event(d['status'], phase='download', file=name, url=info.get('webpage_url'),
+                           downloaded_bytes=d.get('downloaded_bytes'),
+                           total_bytes=d.get('total_bytes'), elapsed=d.get('elapsed'))
+                if d['status'] == 'finished':
+                    self._write(f"✅ Загрузка завершена: {name}\n")
+                self._render()
+    
+    def postprocessor_hook(self, d: dict) -> None:
+        """Postprocessor hook для yt-dlp: этапы слияния и конвертации"""
+        if d['status'] == 'processing':
+            return
+        info = d.get('info_dict') or {}
+        self.event(d['status'], phase='postprocess', postprocessor=d.get('postprocessor'),
+                   file=info.get('filepath'), url=info.get('webpage_url'))
+    
+    def _write(self, text: str) -> None:
+        self._erase()
+        stream = self._stdout or sys.stdout
+        stream.write(text)
+        stream.flush()
+        self._line_open = not text.endswith('\n')
+    
+    def _erase(self) -> None:
+        """Удаление ранее нарисованного блока прогресса"""
+        if self._drawn and self._stdout is not None:
+            self._stdout.write(f"\x1b[{self._drawn}F\x1b[J")
+        self._drawn = 0
+    
+    @staticmethod
+    def _format_line(name: str, state: dict) -> str:
+        total = state['total_bytes']
+        done = state['downloaded_bytes']
+        percent = f"{done / total * 100:5.1f}%" if total else '  ?  '
+        speed = f"{human_size(state['speed'])}/с" if state['speed'] else '-'
+        eta = f"{int(state['eta']) // 60:02d}:{int(state['eta']) % 60:02d}" if state['eta'] is not None else '--:--'
+        title = os.path.basename(name)
+        if len(title) > 40:
+            title = title[:37] + '...'
+        return f"📥 {percent} {human_size(done)} / {human_size(total)}  {speed}  ETA {eta}  {title}"
+    
+    def _render(self) -> None:
+        if not self._active:
+            self._erase()
+            return
+        if self._stdout is None:
+            # Без перехвата stdout - одна строка, только в терминале
+            if sys.stdout.isatty():
+                name, state = next(reversed(self._active.items()))
+                sys.stdout.write('\r' + self._format_line(name, state))
+                sys.stdout.flush()
+                self._line_open = True
+            return
+        lines = [self._format_line(name, state) for name, state in self._active.items()]
+        if len(lines) > 1:
+            done = sum(s['downloaded_bytes'] for s in self._active.values())
+            speed = sum(s['speed'] or 0 for s in self._active.values())
+            lines.append(f"Σ  активных загрузок: {len(lines)}, {human_size(done)}, {human_size(speed)}/с")
+        self._erase()
+        prefix = '\n' if self._line_open else ''
+        self._stdout.write(prefix + '\n'.join(lines) + '\n')
+        self._stdout.flush()
+        self._line_open = False
+        self._drawn = len(lines)
+
+
+class DownloadMetrics:
+    """
+    Метрики загрузок: счётчики результатов, время этапов, байты и повторы
+    
+    Этапы (phase): queue_wait - ожидание в очереди пакета, rate_limit -
+    пауза ограничителя запросов, extract - извлечение метаданных, fetch -
+    передача данных, merge - слияние потоков, postprocess - прочая
+    постобработка. Экспорт: текст в формате Prometheus (файл для textfile
+    collector или HTTP /metrics) и JSON-отчёт по запуску.
+    
+    Извлечение аудио учитывается отдельно по путям copy / transcode:
+    экономия процессора на копировании оценивается по времени процессора
+    ffmpeg на секунду перекодированного аудио в этом запуске (или
+    TRANSCODE_RATE; вне пула постобработки - по времени работы ffmpeg,
+    см. AudioExtractMixin).
+    """
+    
+    PHASES = ('queue_wait', 'rate_limit', 'extract', 'fetch', 'merge', 'postprocess')
+    # Время перекодирования секунды аудио в MP3 (≈ 100x реального времени),
+    # если перекодирований в запуске не было
+    TRANSCODE_RATE = 0.01
+    
+    def __init__(self, textfile_path: Optional[str] = None, keep_items: bool = True):
+        """
+        Args:
+            textfile_path: Файл метрик Prometheus, обновляется после каждой загрузки
+            keep_items: Хранить данные по каждому URL для JSON-отчёта (без
+                них память не растёт с длиной списка)
+        """
+        self.textfile_path = textfile_path
+        self.keep_items = keep_items
+        self.started = time.time()
+        self._lock = threading.Lock()
+        # Запись файла метрик из разных потоков - по очереди
+        self._write_lock = threading.Lock()
+        self._downloads = {'success': 0, 'error': 0, 'skipped': 0}
+        self._phase_sum = {phase: 0.0 for phase in self.PHASES}
+        self._phase_count = {phase: 0 for phase in self.PHASES}
+        self._bytes = 0
+        self._retries = 0
+        # Неудачные попытки, после которых URL повторяется (в _downloads не входят)
+        self._retried_attempts = 0
+        # Извлечение аудио по путям: файлы, секунды аудио, время ffmpeg
+        self._audio = {path: {'files': 0, 'duration': 0.0, 'seconds': 0.0}
+                       for path in ('copy', 'transcode')}
+        self._items: List[dict] = []
+        self._server = None
+    
+    def record(self, result: DownloadResult, final: bool = True) -> None:
+        """
+        Учёт результата загрузки одного URL
+        
+        final=False - неудачная попытка, после которой URL будет повторён:
+        учитываются её время и повторы, но не результат - итог URL
+        записывается один раз, по последней попытке.
+        """
+        status = 'skipped' if result.skipped else 'success' if result.success else 'error'
+        with self._lock:
+            for phase in self.PHASES:
+                if phase in result.timings:
+                    self._phase_sum[phase] += result.timings[phase]
+                    self._phase_count[phase] += 1
+            self._bytes += result.bytes
+            self._retries += result.retries
+            if not final:
+                self._retried_attempts += 1
+            else:
+                self._downloads[status] += 1
+            if final and result.success and result.audio_path in self._audio:
+                audio = self._audio[result.audio_path]
+                audio['files'] += 1
+                audio['duration'] += result.audio_duration
+                audio['seconds'] += result.timings.get('audio', 0.0)
+            if final and self.keep_items:
+                self._items.append({
+                    'url': result.url, 'status': status, 'bytes': result.bytes,
+                    'retries': result.retries, 'formats': result.formats,
+                    'filepath': result.filepath, 'error': result.error,
+                    'audio_path': result.audio_path,
+                    'timings': {k: round(v, 3) for k, v in result.timings.items()},
+                })
+        if self.textfile_path:
+            self.write_textfile(self.textfile_path)
+    
+    def throughput(self) -> float:
+        """Средняя скорость передачи данных, байт/с (без учёта пауз и постобработки)"""
+        fetch = self._phase_sum['fetch']
+        return self._bytes / fetch if fetch else 0.0
+    
+    def _audio_saved(self) -> float:
+        """Оценка времени процессора, сэкономленного копированием аудио без перекодирования"""
+        copy, transcode = self._audio['copy'], self._audio['transcode']
+        rate = self.TRANSCODE_RATE
+        if transcode['duration']:
+            rate = transcode['seconds'] / transcode['duration']
+        return max(0.0, copy['duration'] * rate - copy['seconds'])
+    
+    def audio_totals(self) -> dict:
+        """Итоги извлечения аудио: файлы и время по путям, оценка экономии"""
+        with self._lock:
+            totals = {path: dict(values) for path, values in self._audio.items()}
+            totals['saved_seconds'] = self._audio_saved()
+        return totals
+    
+    def phase_totals(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._phase_sum)
+    
+    def to_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            lines = [
+                '# HELP ytdl_downloads_total Processed URLs by result.',
+                '# TYPE ytdl_downloads_total counter',
+            ]
+            lines += [f'ytdl_downloads_total{{status="{status}"}} {count}'
+                      for status, count in self._downloads.items()]
+            lines += [
+                '# HELP ytdl_phase_seconds Time spent per download phase.',
+                '# TYPE ytdl_phase_seconds summary',
+            ]
+            for phase in self.PHASES:
+                lines.append(f'ytdl_phase_seconds_sum{{phase="{phase}"}} {self._phase_sum[phase]:.6f}')
+                lines.append(f'ytdl_phase_seconds_count{{phase="{phase}"}} {self._phase_count[phase]}')
+            lines += [
+                '# HELP ytdl_downloaded_bytes_total Bytes of completed downloads.',
+                '# TYPE ytdl_downloaded_bytes_total counter',
+                f'ytdl_downloaded_bytes_total {self._bytes}',
+                '# HELP ytdl_retries_total Retried ranges and re-extractions.',
+                '# TYPE ytdl_retries_total counter',
+                f'ytdl_retries_total {self._retries}',
+                '# HELP ytdl_retried_attempts_total Failed attempts whose URL was retried later.',
+                '# TYPE ytdl_retried_attempts_total counter',
+                f'ytdl_retried_attempts_total {self._retried_attempts}',
+                '# HELP ytdl_throughput_bytes_per_second Bytes per second of transfer time.',
+                '# TYPE ytdl_throughput_bytes_per_second gauge',
+                f'ytdl_throughput_bytes_per_second {self.throughput():.1f}',
+                '# HELP ytdl_audio_files_total Extracted audio files by path (copy or transcode).',
+                '# TYPE ytdl_audio_files_total counter',
+                *(f'ytdl_audio_files_total{{path="{path}"}} {values["files"]}'
+                  for path, values in self._audio.items()),
+                '# HELP ytdl_audio_cpu_saved_seconds Estimated ffmpeg CPU seconds saved by stream copy.',
+                '# TYPE ytdl_audio_cpu_saved_seconds gauge',
+                f'ytdl_audio_cpu_saved_seconds {self._audio_saved():.3f}',
+                '# HELP ytdl_run_start_timestamp_seconds Start time of the current run.',
+                '# TYPE ytdl_run_start_timestamp_seconds gauge',
+                f'ytdl_run_start_timestamp_seconds {self.started:.0f}',
+            ]
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, path: str) -> None:
+        """Атомарная запись метрик (для textfile collector node_exporter)"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._write_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+    
+    def report(self) -> dict:
+        """JSON-отчёт по запуску: итоги и данные по каждому URL"""
+        with self._lock:
+            return {
+                'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'finished': datetime.now().isoformat(timespec='seconds'),
+                'downloads': dict(self._downloads),
+                'bytes': self._bytes,
+                'retries': self._retries,
+                'retried_attempts': self._retried_attempts,
+                'throughput_bytes_per_second': round(self.throughput(), 1),
+                'phase_seconds': {k: round(v, 3) for k, v in self._phase_sum.items()},
+                'audio': {
+                    **{path: {k: round(v, 3) for k, v in values.items()}
+                       for path, values in self._audio.items()},
+                    'cpu_saved_seconds': round(self._audio_saved(), 3),
+                },
+                'items': list(self._items),
+            }
+    
+    def write_report(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=2)
+    
+    def serve(self, port: int, host: str = '127.0.0.1') -> None:
+        """HTTP-эндпоинт /metrics в фоновом потоке"""
+        # Импорт только при включённом эндпоинте - не замедляет каждый запуск
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+class MetadataCache:
+    """
+    Дисковый кэш info-словарей yt-dlp (SQLite) с ключом по ID видео
+    
+    Запись живёт не дольше ttl и не дольше срока действия подписанных
+    ссылок на форматы (параметр expire). При превышении max_bytes удаляются
+    записи, к которым дольше всего не обращались (LRU).
+    """
+    
+    def __init__(self, path: str, ttl: float = 6 * 3600,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, info TEXT NOT NULL, size INTEGER NOT NULL, '
+            'expires REAL NOT NULL, accessed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._db.commit()
+    
+    @staticmethod
+    def _links_expire(info: dict) -> Optional[float]:
+        """Ближайший срок действия подписанных ссылок на форматы"""
+        expires = []
+        for fmt in info.get('formats') or []:
+            value = parse_qs(urlparse(fmt.get('url') or '').query).get('expire')
+            if value and value[0].isdigit():
+                expires.append(float(value[0]))
+        return min(expires) if expires else None
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Получение info-словаря, если запись ещё действительна"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT info, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+    
+    def put(self, key: str, info: dict) -> None:
+        """Сохранение info-словаря с вытеснением устаревших и LRU-записей"""
+        now = time.time()
+        expires = now + self.ttl
+        links_expire = self._links_expire(info)
+        if links_expire is not None:
+            # Запас в минуту, чтобы ссылка не истекла в начале загрузки
+            expires = min(expires, links_expire - 60)
+        if expires <= now:
+            return
+        data = json.dumps(info, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (key, info, size, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?)', (key, data, len(data), expires, now))
+            self._db.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in self._db.execute(
+                        'SELECT key, size FROM entries ORDER BY accessed').fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._db.execute('DELETE FROM entries WHERE key = ?', (old_key,))
+                    total -= size
+            self._db.commit()
+    
+    def invalidate(self, key: str) -> None:
+        """Удаление записи (например, если ссылки из кэша перестали работать)"""
+        with self._lock:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._db.commit()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками по 1 МБ)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadArchive:
+    """
+    Архив завершённых загрузок (SQLite): ключ видео -> путь, размер,
+    контрольная сумма и форматы итогового файла
+    
+    Запись считается действительной, пока файл существует и его размер
+    совпадает с сохранённым; иначе она удаляется при проверке.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS downloads ('
+            'key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, '
+            'sha256 TEXT NOT NULL, format TEXT, completed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS downloads_path ON downloads (path)')
+        self._db.commit()
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Запись о завершённой загрузке, если файл всё ещё на месте"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT path, size, sha256, format FROM downloads WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            path, size, sha256, fmt = row
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                self._db.execute('DELETE FROM downloads WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+        return {'path': path, 'size': size, 'sha256': sha256, 'format': fmt}
+    
+    def keys_for(self, path: str) -> set:
+        """Ключи загрузок, записанных в этот файл"""
+        with self._lock:
+            rows = self._db.execute('SELECT key FROM downloads WHERE path = ?',
+                                    (os.path.abspath(path),)).fetchall()
+        return {key for key, in rows}
+    
+    def add(self, key: str, path: str, fmt: str, sha256: Optional[str] = None) -> None:
+        """Запись завершённой загрузки (sha256 - уже посчитанная сумма файла)"""
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        sha256 = sha256 or file_sha256(path)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO downloads (key, path, size, sha256, format, completed) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (key, path, size, sha256, fmt, time.time()))
+            self._db.commit()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class ContentStore:
+    """
+    Общее хранилище загруженных файлов с индексом (SQLite)
+    
+    Файл хранится один раз в objects/ под именем из ID видео, форматов и
+    SHA-256 содержимого, а в папки загрузок попадают жёсткие (или
+    символические) ссылки на него. Видео из нескольких списков скачивается
+    и занимает место на диске один раз, а разные видео с одинаковым
+    названием в хранилище не пересекаются.
+    
+    Индекс: ключ загрузки (как в архиве) -> объект, размер, SHA-256,
+    форматы и исходное имя файла. Запись действительна, пока объект на
+    месте и его размер совпадает с сохранённым.
+    """
+    
+    LINK_MODES = ('hard', 'symlink')
+    
+    def __init__(self, root: str, link_mode: str = 'hard'):
+        self.root = os.path.abspath(root)
+        self.link_mode = link_mode
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'),
+                                   check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS artifacts ('
+            'key TEXT PRIMARY KEY, object TEXT NOT NULL, size INTEGER NOT NULL, '
+            'sha256 TEXT NOT NULL, format TEXT, name TEXT NOT NULL, completed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts (sha256)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS artifacts_name ON artifacts (name)')
+        self._db.commit()
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Объект хранилища для ключа загрузки, если он всё ещё на месте"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT object, size, sha256, format, name FROM artifacts WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            obj, size, sha256, fmt, name = row
+            path = os.path.join(self.root, obj)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                self._db.execute('DELETE FROM artifacts WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+        return {'path': path, 'size': size, 'sha256': sha256, 'format': fmt, 'name': name}
+    
+    def keys_for(self, path: str) -> set:
+        """Ключи загрузок, ссылкой на объект которых является файл path"""
+        with self._lock:
+            rows = self._db.execute('SELECT key, object FROM artifacts WHERE name = ?',
+                                    (os.path.basename(path),)).fetchall()
+        keys = set()
+        for key, obj in rows:
+            try:
+                if os.path.samefile(path, os.path.join(self.root, obj)):
+                    keys.add(key)
+            except OSError:
+                pass
+        return keys
+    
+    def link(self, source: str, target: str) -> None:
+        """
+        Ссылка target на объект хранилища
+        
+        Жёсткая ссылка невозможна между файловыми системами - тогда
+        символическая, а если нет и её (Windows без прав) - копия.
+        """
+        if self.link_mode == 'hard':
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        try:
+            os.symlink(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    
+    def _existing(self, sha256: str) -> Optional[str]:
+        """Объект с тем же содержимым, если он есть (вызывается под блокировкой)"""
+        row = self._db.execute('SELECT object FROM artifacts WHERE sha256 = ? LIMIT 1',
+                               (sha256,)).fetchone()
+        if row and os.path.isfile(os.path.join(self.root, row[0])):
+            return row[0]
+        return None
+    
+    def _index(self, obj: str, key: str, size: int, sha256: str, fmt: str, name: str) -> None:
+        """Запись индекса для ключа загрузки (вызывается под блокировкой)"""
+        self._db.execute(
+            'INSERT OR REPLACE INTO artifacts (key, object, size, sha256, format, name, completed) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, obj, size, sha256, fmt, name, time.time()))
+        self._db.commit()
+    
+    def add(self, key: str, path: str, fmt: str, sha256: Optional[str] = None) -> str:
+        """
+        Перенос загруженного файла в хранилище, на его месте остаётся ссылка
+        
+        Файл с тем же содержимым, уже лежащий в хранилище, не дублируется.
+        Перенос (копирование, если хранилище на другом диске) идёт без
+        блокировки во временный файл хранилища; под блокировкой только
+        проверка дубликата, переименование и запись индекса.
+        
+        Args:
+            sha256: Уже посчитанная сумма файла
+        
+        Returns:
+            Путь к объекту хранилища
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        sha256 = sha256 or file_sha256(path)
+        row = (key, size, sha256, fmt, os.path.basename(path))
+        with self._lock:
+            obj = self._existing(sha256)
+            if obj is not None:
+                self._index(obj, *row)
+        if obj is None:
+            # Ключ Generic - URL: в имени объекта только его начало
+            video = key.rsplit('/', 1)[0][:100]
+            name = f"{video}.{fmt or 'unknown'}.{sha256[:16]}{os.path.splitext(path)[1]}"
+            target = os.path.join('objects', sha256[:2], re.sub(r'[^\w.+-]', '_', name))
+            tmp_path = os.path.join(self.root, f"{target}.{os.getpid()}.{threading.get_ident()}.tmp")
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+            shutil.move(path, tmp_path)
+            with self._lock:
+                # Тот же файл мог быть добавлен другим потоком за время переноса;
+                # запись индекса - в той же блокировке, чтобы следующий поток её увидел
+                obj = self._existing(sha256)
+                if obj is None:
+                    obj = target
+                    os.replace(tmp_path, os.path.join(self.root, obj))
+                self._index(obj, *row)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            os.remove(path)
+        self.link(os.path.join(self.root, obj), path)
+        return os.path.join(self.root, obj)
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class BandwidthStore:
+    """
+    Измеренная скорость загрузки по хостам (SQLite): экспоненциальное
+    среднее по завершённым загрузкам
+    
+    Узлы CDN вида rr3---sn-xxx.googlevideo.com сводятся к общему хосту,
+    чтобы измерения разных видео одного сервиса накапливались вместе.
+    Измерения старше max_age не используются.
+    """
+    
+    def __init__(self, path: str, alpha: float = 0.3, max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.alpha = alpha
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS bandwidth ('
+            'host TEXT PRIMARY KEY, bps REAL NOT NULL, samples INTEGER NOT NULL, '
+            'updated REAL NOT NULL)')
+        self._db.commit()
+    
+    @staticmethod
+    def host(url: str) -> str:
+        """Хост для учёта скорости: без номера узла CDN в первой метке"""
+        host = (urlparse(url).hostname or '').lower()
+        labels = host.split('.')
+        if len(labels) > 2 and not host.replace('.', '').isdigit() and re.search(r'\d', labels[0]):
+            return '.'.join(labels[1:])
+        return host
+    
+    def get(self, host: str) -> Optional[float]:
+        """Средняя скорость загрузки с хоста, байт/с"""
+        with self._lock:
+            row = self._db.execute('SELECT bps, updated FROM bandwidth WHERE host = ?',
+                                   (host,)).fetchone()
+        if row is None or time.time() - row[1] > self.max_age:
+            return None
+        return row[0]
+    
+    def add(self, host: str, bps: float) -> None:
+        """Учёт измеренной скорости одной загрузки"""
+        if not host or bps <= 0:
+            return
+        with self._lock:
+            row = self._db.execute('SELECT bps, samples, updated FROM bandwidth WHERE host = ?',
+                                   (host,)).fetchone()
+            samples = 1
+            if row is not None and time.time() - row[2] <= self.max_age:
+                bps = self.alpha * bps + (1 - self.alpha) * row[0]
+                samples = row[1] + 1
+            self._db.execute(
+                'INSERT OR REPLACE INTO bandwidth (host, bps, samples, updated) VALUES (?, ?, ?, ?)',
+                (host, bps, samples, time.time()))
+            self._db.commit()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class FFmpegCache:
+    """
+    Дисковый кэш поиска ffmpeg и проверки его версии и возможностей (JSON)
+    
+    Поиск в PATH и стандартных путях и запуск ffmpeg/ffprobe для проверки
+    версии выполняются один раз: запись действительна, пока не изменились
+    PATH и сам файл ffmpeg (время изменения и размер). Результаты проверки
+    передаются в кэш постобработчиков yt-dlp, и он не запускает ffmpeg
+    для этого повторно в каждом процессе.
+    """
+    
+    # Стандартные пути установки ffmpeg в Windows
+    POSSIBLE_PATHS = (
+        'C:\\ProgramData\\chocolatey\\bin\\ffmpeg.exe',
+        'C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe',
+        'C:\\ffmpeg\\bin\\ffmpeg.exe',
+    )
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seeded = False
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                self._data = json.load(file)
+        except (OSError, ValueError):
+            self._data = {}
+    
+    @staticmethod
+    def _stat(path: str) -> Optional[list]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
+    
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self._data, file, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+    
+    def find(self) -> Optional[str]:
+        """Путь к ffmpeg: из кэша, если он действителен, иначе поиск заново"""
+        env = os.environ.get('PATH', '')
+        cached = self._data.get('ffmpeg')
+        if (cached and self._data.get('env') == env
+                and self._stat(cached) == self._data.get('stat')):
+            return cached
+        path = shutil.which('ffmpeg') or next(
+            (path for path in self.POSSIBLE_PATHS if os.path.exists(path)), None)
+        # Ненайденный ffmpeg не кэшируется: его могут установить в любой момент
+        if path:
+            self._data = {'env': env, 'ffmpeg': path, 'stat': self._stat(path)}
+            self._save()
+        return path
+    
+    def seed(self, ydl) -> None:
+        """
+        Версия и возможности ffmpeg для постобработчиков yt-dlp
+        
+        Из кэша, а без него - однократной проверкой через yt-dlp с
+        сохранением результата. Выполняется один раз на процесс.
+        """
+        if self._seeded or not ydl.params.get('ffmpeg_location'):
+            return
+        with self._lock:
+            if self._seeded:
+                return
+            pp_class = yt_dlp.postprocessor.FFmpegPostProcessor
+            if self._data.get('versions') and self._data.get('ffmpeg') == ydl.params['ffmpeg_location']:
+                pp_class._version_cache.update(self._data['versions'])
+                pp_class._features_cache.update(self._data.get('features') or {})
+            else:
+                pp = pp_class(ydl)
+                if pp.available:
+                    _ = pp.probe_available  # свойство запускает проверку ffprobe
+                    paths = [path for path in pp._paths.values() if path in pp_class._version_cache]
+                    self._data['versions'] = {path: pp_class._version_cache[path] for path in paths}
+                    self._data['features'] = {path: pp_class._features_cache[path] for path in paths
+                                              if path in pp_class._features_cache}
+                    self._save()
+            self._seeded = True
+
+
+@dataclass
+class FormatPlan:
+    """Варианты форматов одного видео от лучшего к худшему и текущий выбор"""
+    candidates: List[dict]
+    index: int
+    bps: Optional[float] = None
+    
+    @property
+    def current(self) -> dict:
+        return self.candidates[self.index]
+
+
+class AdaptiveFormatSelector:
+    """
+    Выбор формата по измеренной скорости и ограничениям на время и размер
+    
+    Из списка форматов видео собираются варианты (видео + лучшее аудио или
+    готовый формат) с оценкой размера по filesize, filesize_approx или
+    tbr * duration. Выбирается лучший вариант не выше --quality, который
+    укладывается в max_bytes и, если скорость хоста уже измерена, в
+    target_time. Если загрузка идёт в slow_factor раз дольше прогноза,
+    выбирается следующий вариант меньшего размера.
+    """
+    
+    def __init__(self, bandwidth: BandwidthStore, target_time: Optional[float] = None,
+                 max_bytes: Optional[int] = None, slow_factor: float = 3.0,
+                 min_deadline: float = 15.0):
+        self.bandwidth = bandwidth
+        self.target_time = target_time
+        self.max_bytes = max_bytes
+        self.slow_factor = slow_factor
+        self.min_deadline = min_deadline
+    
+    @staticmethod
+    def _size(fmt: dict, duration: Optional[float]) -> Optional[float]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        return size
+    
+    def candidates(self, info: dict, quality: str, audio_only: bool) -> List[dict]:
+        """Варианты загрузки от лучшего к худшему"""
+        duration = info.get('duration')
+        formats = [f for f in info.get('formats') or []
+                   if f.get('url') and f.get('format_id') and f.get('ext') != 'mhtml']
+        audio = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+        height_cap = int(quality[:-1]) if re.fullmatch(r'\d+p', quality) else None
+        
+        def option(fmts: List[dict], height: Optional[int]) -> dict:
+            sizes = [self._size(f, duration) for f in fmts]
+            return {
+                'spec': '+'.join(f['format_id'] for f in fmts),
+                'bytes': sum(sizes) if all(sizes) else None,
+                'height': height or 0,
+                'tbr': sum(f.get('tbr') or 0 for f in fmts),
+                'host': BandwidthStore.host(fmts[0]['url']),
+            }
+        
+        if audio_only:
+            options = [option([f], None) for f in audio]
+        else:
+            # Аудио для слияния: m4a совместим с mp4, затем по битрейту
+            best_audio = max(audio, default=None, key=lambda f: (
+                f.get('ext') == 'm4a', f.get('abr') or f.get('tbr') or 0))
+            options = []
+            for f in formats:
+                if f.get('vcodec') == 'none' or (height_cap and (f.get('height') or 0) > height_cap):
+                    continue
+                if f.get('acodec') != 'none':
+                    options.append(option([f], f.get('height')))
+                elif best_audio:
+                    options.append(option([f, best_audio], f.get('height')))
+        options.sort(key=lambda o: (o['height'], o['tbr']), reverse=True)
+        return options
+    
+    def _fits(self, option: dict, bps: Optional[float]) -> bool:
+        if option['bytes'] is None:
+            return False
+        if self.max_bytes and option['bytes'] > self.max_bytes:
+            return False
+        if self.target_time and bps and option['bytes'] / bps > self.target_time:
+            return False
+        return True
+    
+    def _pick(self, options: List[dict], bps: Optional[float]) -> Optional[int]:
+        for i, option in enumerate(options):
+            if self._fits(option, bps):
+                return i
+        # Ничего не укладывается - наименьший вариант с известным размером
+        sized = [i for i, o in enumerate(options) if o['bytes'] is not None]
+        return min(sized, key=lambda i: options[i]['bytes']) if sized else None
+    
+    def plan(self, info: dict, quality: str, audio_only: bool) -> Optional[FormatPlan]:
+        """Выбор варианта; None - размер форматов неизвестен, выбор по --quality"""
+        options = self.candidates(info, quality, audio_only)
+        if not options or quality == 'worst':
+            return None
+        bps = self.bandwidth.get(options[0]['host'])
+        index = self._pick(options, bps)
+        return FormatPlan(options, index, bps) if index is not None else None
+    
+    def fallback(self, plan: FormatPlan, measured_bps: Optional[float]) -> bool:
+        """Переход на меньший вариант после медленной загрузки; False - меньших нет"""
+        if measured_bps:
+            plan.bps = measured_bps
+            self.bandwidth.add(plan.current['host'], measured_bps)
+        current = plan.current['bytes']
+        smaller = [i for i, o in enumerate(plan.candidates)
+                   if o['bytes'] is not None and o['bytes'] < current]
+        if not smaller:
+            return False
+        fitting = [i for i in smaller if self._fits(plan.candidates[i], plan.bps)]
+        plan.index = fitting[0] if fitting else min(
+            smaller, key=lambda i: plan.candidates[i]['bytes'])
+        return True
+    
+    def deadline(self, plan: FormatPlan) -> Optional[float]:
+        """Момент (perf_counter), после которого загрузка считается слишком медленной"""
+        if not plan.bps or not plan.current['bytes']:
+            return None
+        predicted = plan.current['bytes'] / plan.bps
+        return time.perf_counter() + max(predicted * self.slow_factor, self.min_deadline)
+
+
+class SegmentedDownloader:
+    """
+    Загрузка одного HTTP-формата в несколько соединений
+    
+    Файл делится на диапазоны байт, которые скачиваются параллельно и
+    записываются по своим смещениям в заранее выделенный (разреженный)
+    .part файл - без последующей склейки. Каждый диапазон повторяется
+    отдельно; список готовых диапазонов хранится рядом в .segments файле,
+    чтобы прерванную загрузку можно было продолжить.
+    """
+    
+    BLOCK_SIZE = 64 * 1024
+    MIN_SEGMENT = 1024 * 1024
+    MAX_SEGMENT = 10 * 1024 * 1024
+    
+    def __init__(self, ydl: yt_dlp.YoutubeDL, connections: int, retries: int = 10):
+        self.ydl = ydl
+        self.connections = connections
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._started = 0.0
+    
+    def _probe(self, url: str, headers: dict) -> Optional[int]:
+        """Размер файла, если сервер поддерживает запросы диапазонов"""
+        request = yt_dlp.networking.Request(url, headers={**headers, 'Range': 'bytes=0-0'})
+        with self.ydl.urlopen(request) as response:
+            if response.status != 206:
+                return None
+            match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    
+    def _report(self, status: dict) -> None:
+        self.ydl.check_cancelled(status)
+        for hook in self.ydl.params.get('progress_hooks') or []:
+            hook(status)
+    
+    def _fetch(self, url: str, headers: dict, part: str, start: int, end: int,
+               status: dict) -> None:
+        """Загрузка диапазона [start, end] с дозагрузкой после обрывов"""
+        pos, attempt = start, 0
+        while pos <= end:
+            try:
+                request = yt_dlp.networking.Request(
+                    url, headers={**headers, 'Range': f'bytes={pos}-{end}'})
+                with self.ydl.urlopen(request) as response, open(part, 'r+b') as file:
+                    if response.status != 206:
+                        raise OSError(f'сервер не вернул диапазон {pos}-{end}')
+                    file.seek(pos)
+                    while pos <= end:
+                        data = response.read(min(self.BLOCK_SIZE, end - pos + 1))
+                        if not data:
+                            break
+                        file.write(data)
+                        pos += len(data)
+                        with self._lock:
+                            self._downloaded += len(data)
+                            elapsed = time.monotonic() - self._started
+                            speed = self._downloaded / elapsed if elapsed else None
+                            status.update({
+                                'downloaded_bytes': self._downloaded,
+                                'elapsed': elapsed,
+                                'speed': speed,
+                                'eta': (status['total_bytes'] - self._downloaded) / speed if speed else None,
+                            })
+                            self._report(status)
+                if pos <= end:
+                    raise OSError(f'соединение закрыто на байте {pos} из {end + 1}')
+            except (yt_dlp.networking.exceptions.RequestError, OSError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                with self._lock:
+                    self.ydl.retry_count += 1
+                time.sleep(min(0.5 * 2 ** attempt, 10))
+    
+    @staticmethod
+    def _save_state(state_path: str, total: int, size: int, done: set) -> None:
+        """Запись списка готовых диапазонов в .segments файл"""
+        with open(state_path, 'w', encoding='utf-8') as file:
+            json.dump({'total': total, 'size': size, 'done': sorted(done)}, file)
+    
+    def download(self, filename: str, info: dict) -> bool:
+        """
+        Скачивание формата в filename
+        
+        Returns:
+            False, если сервер не поддерживает диапазоны или файл слишком
+            мал для разбиения - тогда нужна обычная загрузка
+        """
+        url = info['url']
+        headers = info.get('http_headers') or {}
+        total = self._probe(url, headers)
+        if not total:
+            return False
+        max_segment = (info.get('downloader_options') or {}).get('http_chunk_size') or self.MAX_SEGMENT
+        size = max(self.MIN_SEGMENT, min(max_segment, -(-total // self.connections)))
+        segments = [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+        if len(segments) < 2:
+            return False
+        
+        part = filename + '.part'
+        state_path = part + '.segments'
+        done = set()
+        if os.path.exists(part):
+            state = {}
+            if os.path.exists(state_path):
+                with open(state_path, 'r', encoding='utf-8') as file:
+                    state = json.load(file)
+            if state.get('total') == total and state.get('size') == size:
+                done = set(state['done'])
+            elif not state:
+                # Обычный .part от последовательной загрузки: готово всё до его конца.
+                # .part полного размера без .segments - выделенный, но не записанный файл
+                have = os.path.getsize(part)
+                if have < total:
+                    done = {i for i, (_, end) in enumerate(segments) if end < have}
+        
+        # Состояние записывается до выделения места: прерванная после этого
+        # загрузка не примет разреженный .part за готовый
+        self._save_state(state_path, total, size, done)
+        with open(part, 'ab') as file:
+            file.truncate(total)
+        
+        self._started = time.monotonic()
+        self._downloaded = sum(end - start + 1 for i, (start, end) in enumerate(segments) if i in done)
+        status = {'status': 'downloading', 'filename': filename, 'tmpfilename': part,
+                  'total_bytes': total, 'downloaded_bytes': self._downloaded, 'info_dict': info}
+        
+        pending = [i for i in range(len(segments)) if i not in done]
+        with ThreadPoolExecutor(max_workers=self.connections) as pool:
+            futures = {pool.submit(self._fetch, url, headers, part, *segments[i], status): i
+                       for i in pending}
+            # Готовые диапазоны учитываются и после ошибки в другом диапазоне
+            error = None
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                done.add(futures[future])
+                self._save_state(state_path, total, size, done)
+        if error is not None:
+            raise error
+        
+        os.replace(part, filename)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        self._report({'status': 'finished', 'filename': filename, 'total_bytes': total,
+                      'downloaded_bytes': total, 'elapsed': time.monotonic() - self._started,
+                      'info_dict': info})
+        return True
+
+
+class AudioExtractMixin:
+    """
+    Извлечение аудио с учётом выбранного пути: копирование потока или
+    перекодирование (основа AudioExtractPP, см. load_yt_dlp)
+    
+    yt-dlp перекодирует только если кодек файла отличается от целевого,
+    иначе меняет контейнер с -c copy или оставляет файл как есть. В
+    info-словарь записываются путь ('audio_path': 'copy' или 'transcode'),
+    время процессора ffmpeg ('audio_seconds') и длительность аудио
+    ('audio_duration') для оценки сэкономленного времени процессора.
+    
+    Время процессора - прирост RUSAGE_CHILDREN за время работы: точно в
+    процессе пула постобработки, где задания идут по одному. В потоках
+    загрузки (и без модуля resource) прирост включал бы ffmpeg соседних
+    потоков, поэтому там берётся время работы ffmpeg по часам.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Кодек последнего вызова ffmpeg; экземпляр общий для потоков загрузки
+        self._local = threading.local()
+    
+    def run_ffmpeg(self, path, out_path, codec, more_opts):
+        self._local.codec = codec
+        return super().run_ffmpeg(path, out_path, codec, more_opts)
+    
+    def run(self, information):
+        # Без вызова ffmpeg файл остаётся в исходном виде - тоже путь без перекодирования
+        self._local.codec = 'copy'
+        started = self._cpu_time()
+        files_to_delete, information = super().run(information)
+        information['audio_path'] = 'copy' if self._local.codec == 'copy' else 'transcode'
+        information['audio_seconds'] = self._cpu_time() - started
+        information['audio_duration'] = (information.get('duration')
+                                          or self._media_duration(information['filepath']))
+        return files_to_delete, information
+    
+    @staticmethod
+    def _cpu_time() -> float:
+        """Время процессора завершённых дочерних процессов (см. описание класса)"""
+        if resource is None or not _PP_WORKER:
+            return time.perf_counter()
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    
+    def _media_duration(self, path: str) -> Optional[float]:
+        """Длительность файла через ffprobe, а без него - по выводу ffmpeg -i"""
+        if self.probe_basename == 'ffprobe':
+            return self._get_real_video_duration(path, fatal=False)
+        try:
+            output = subprocess.run([self.executable, '-hide_banner', '-i', path],
+                                    capture_output=True, text=True, errors='replace').stderr
+        except OSError:
+            return None
+        match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', output)
+        if not match:
+            return None
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+class FastYoutubeDLMixin:
+    """
+    YoutubeDL с дополнительными режимами загрузки (основа FastYoutubeDL,
+    см. load_yt_dlp)
+    
+    - 'segment_connections' > 1: HTTP-форматы скачиваются через
+      SegmentedDownloader в несколько соединений;
+    - 'stream_pipeline' == 'parallel': потоки видео и аудио для слияния
+      скачиваются одновременно, слияние ждёт завершения обоих;
+    - 'stream_pipeline' == 'stream': оба потока читает сам ffmpeg и сразу
+      объединяет их с -c copy, итоговый файл записывается один раз;
+    - 'audio_format': извлечение аудио (AudioExtractPP) в заданный кодек
+      или 'best' - без перекодирования.
+    
+    В остальных случаях используется обычный загрузчик yt-dlp. Экстракторы
+    регистрируются не все сразу, а только нужные извлекаемым URL.
+    """
+    
+    def __init__(self, params: Optional[dict] = None):
+        super().__init__(params, auto_init=False)
+        # Повторы диапазонов для метрик; сбрасывается перед каждой загрузкой
+        self.retry_count = 0
+        # Событие отмены текущей загрузки (проверяется в progress hook)
+        self.cancel_event: Optional[threading.Event] = None
+        # Срок адаптивной загрузки (perf_counter) и последняя скорость из хука
+        self.deadline: Optional[float] = None
+        self.last_speed: Optional[float] = None
+        self.default_format_selector = self.format_selector
+        self._stream_pool: Optional[ThreadPoolExecutor] = None
+        self._stream_futures: list = []
+        # Пул процессов для постобработки текущей загрузки и её задание
+        self.postprocess_pool: Optional['PostprocessPool'] = None
+        self.pending_postprocess: Optional[Future] = None
+        self.add_progress_hook(self.check_cancelled)
+        if self.params.get('audio_format'):
+            # Извлечение аудио - первым, до встраивания обложки и прочих шагов
+            pp = AudioExtractPP(self, preferredcodec=self.params['audio_format'])
+            self._pps['post_process'].insert(0, pp)
+    
+    def extract_info(self, url, download=True, ie_key=None, *args, **kwargs):
+        # Экстрактор выбирается так же, как в yt-dlp, но без регистрации всех остальных
+        if not ie_key and not kwargs.get('force_generic_extractor'):
+            ie = url_extractor(url)
+            ie_key = ie.ie_key() if ie else 'Generic'
+        if ie_key:
+            self.get_info_extractor(ie_key)
+        return super().extract_info(url, download, ie_key, *args, **kwargs)
+    
+    def check_cancelled(self, d: Optional[dict] = None) -> None:
+        """Прерывание загрузки, если она отменена или идёт намного дольше прогноза"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled('загрузка отменена')
+        if d and d.get('status') == 'downloading':
+            self.last_speed = d.get('speed') or self.last_speed
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SlowDownloadError('загрузка медленнее прогноза')
+    
+    def process_info(self, info_dict):
+        formats = info_dict.get('requested_formats') or []
+        pipeline = self.params.get('stream_pipeline') if len(formats) > 1 else None
+        if pipeline == 'parallel':
+            self._stream_pool = ThreadPoolExecutor(max_workers=len(formats))
+        elif pipeline == 'stream':
+            # Прямое слияние возможно только загрузчиком ffmpeg
+            saved_downloader = self.params.get('external_downloader')
+            self.params['external_downloader'] = {'default': 'ffmpeg'}
+        try:
+            return super().process_info(info_dict)
+        finally:
+            if pipeline == 'parallel':
+                self._join_streams()
+            elif pipeline == 'stream':
+                self.params['external_downloader'] = saved_downloader
+    
+    def _join_streams(self) -> None:
+        """
+        Ожидание параллельных загрузок потоков
+        
+        Исключение первого неудачного потока передаётся дальше как есть:
+        по его типу работают переход на меньший формат (SlowDownloadError),
+        отмена и классификация ошибок для повторов.
+        """
+        pool, self._stream_pool = self._stream_pool, None
+        futures, self._stream_futures = self._stream_futures, []
+        if pool is None:
+            return
+        error = None
+        for future in futures:
+            try:
+                success, _ = future.result()
+                if not success and error is None:
+                    error = yt_dlp.utils.DownloadError('загрузка потока не удалась')
+            except Exception as e:
+                error = error or e
+        pool.shutdown()
+        if error is not None:
+            raise error
+    
+    def post_process(self, filename, info, files_to_move=None):
+        # Слияние и прочая постобработка - только после загрузки всех потоков
+        self._join_streams()
+        if self.postprocess_pool is not None:
+            future = self.postprocess_pool.submit(self, filename, info, files_to_move)
+            if future is not None:
+                # Постобработка идёт в пуле процессов, поток свободен для загрузок
+                self.pending_postprocess = future
+                info.pop('__postprocessors', None)
+                info['filepath'] = filename
+                return info
+        return super().post_process(filename, info, files_to_move)
+    
+    def dl(self, name, info, subtitle=False, test=False):
+        if self._stream_pool is not None and not subtitle and not test:
+            self._stream_futures.append(self._stream_pool.submit(self._dl_now, name, info))
+            return True, True
+        return self._dl_now(name, info, subtitle, test)
+    
+    def _dl_now(self, name, info, subtitle=False, test=False):
+        connections = self.params.get('segment_connections') or 1
+        if (connections > 1 and not subtitle and not test and name != '-'
+                and not self.params.get('nopart')
+                and info.get('protocol') in ('http', 'https') and info.get('url')):
+            downloader = SegmentedDownloader(self, connections, self.params.get('retries', 10))
+            if downloader.download(name, info):
+                return True, True
+        return super().dl(name, info, subtitle=subtitle, test=test)
+
+
+# Классы на основе классов yt-dlp; определяются в load_yt_dlp()
+SlowDownloadError = None
+AudioExtractPP = None
+FastYoutubeDL = None
+_yt_dlp_lock = threading.Lock()
+
+
+def load_yt_dlp() -> None:
+    """
+    Импорт yt-dlp и определение классов, наследующих его классы
+    
+    Вызывается перед первым созданием YoutubeDL: модуль загружается без
+    yt-dlp, и запуск с ошибкой в аргументах или справкой его не импортирует.
+    """
+    global SlowDownloadError, AudioExtractPP, FastYoutubeDL
+    if FastYoutubeDL is not None:
+        return
+    with _yt_dlp_lock:
+        if FastYoutubeDL is not None:
+            return
+        SlowDownloadError = type('SlowDownloadError', (yt_dlp.utils.DownloadCancelled,), {
+            '__module__': __name__,
+            '__doc__': 'Загрузка идёт намного медленнее прогноза адаптивного выбора формата',
+        })
+        AudioExtractPP = type('AudioExtractPP', (
+            AudioExtractMixin, yt_dlp.postprocessor.FFmpegExtractAudioPP), {'__module__': __name__})
+        FastYoutubeDL = type('FastYoutubeDL', (FastYoutubeDLMixin, yt_dlp.YoutubeDL),
+                             {'__module__': __name__})
+
+
+# Данные AudioExtractPP в info-словаре после постобработки
+AUDIO_KEYS = ('audio_path', 'audio_seconds', 'audio_duration')
+
+# Экземпляры YoutubeDL процесса постобработки по настройкам
+_PP_SESSIONS: Dict[str, yt_dlp.YoutubeDL] = {}
+# Время этапов текущего задания процесса постобработки
+_PP_TIMINGS: Dict[str, float] = {}
+# Процесс пула постобработки: задания в нём выполняются по одному
+_PP_WORKER = False
+
+
+def _pp_timer(d: dict) -> None:
+    """Учёт времени слияния и прочей постобработки в процессе пула"""
+    if d['status'] == 'started':
+        _PP_TIMINGS['_started'] = time.perf_counter()
+    elif d['status'] == 'finished':
+        phase = 'merge' if d.get('postprocessor') == 'Merger' else 'postprocess'
+        elapsed = time.perf_counter() - _PP_TIMINGS.pop('_started', time.perf_counter())
+        _PP_TIMINGS[phase] = _PP_TIMINGS.get(phase, 0.0) + elapsed
+
+
+def _postprocess_job(payload: bytes) -> dict:
+    """
+    Постобработка одной загрузки в процессе пула
+    
+    Выполняет ту же цепочку, что и YoutubeDL.post_process: постобработчики
+    этой загрузки (слияние, исправления контейнера) и заданные в настройках
+    (перекодирование, обложка), затем перенос файлов.
+    """
+    global _PP_WORKER
+    # Процесс запускается заново (spawn): классы на основе yt-dlp нужны до распаковки
+    load_yt_dlp()
+    _PP_WORKER = True
+    params, filename, info, files_to_move, pp_classes = pickle.loads(payload)
+    key = json.dumps(params, sort_keys=True, default=str)
+    ydl = _PP_SESSIONS.get(key)
+    if ydl is None:
+        ydl = _PP_SESSIONS[key] = FastYoutubeDL(params)
+        FFmpegCache(str(DATA_DIR / 'ffmpeg.json')).seed(ydl)
+        ydl.add_postprocessor_hook(_pp_timer)
+    _PP_TIMINGS.clear()
+    info['__postprocessors'] = [pp_class(ydl) for pp_class in pp_classes]
+    info = ydl.post_process(filename, info, files_to_move)
+    _PP_TIMINGS.pop('_started', None)
+    return {'filepath': info.get('filepath'), 'timings': dict(_PP_TIMINGS),
+            'audio': {key: info[key] for key in AUDIO_KEYS if key in info}}
+
+
+class PostprocessPool:
+    """
+    Пул процессов для постобработки: слияние потоков, перекодирование,
+    встраивание обложек
+    
+    Загрузка передаёт скачанные файлы в очередь пула и сразу освобождает
+    поток для следующего видео, а ffmpeg работает в отдельных процессах
+    (по умолчанию по одному на ядро). Время пакета стремится к большему
+    из времени сети и времени процессора вместо их суммы. В очереди не
+    больше 2 * workers заданий: если постобработка отстаёт, новые
+    загрузки ждут свободного места.
+    
+    Процессы запускаются через spawn, а не fork: родитель многопоточный,
+    и скопированная блокировка (например, вывода прогресса) могла бы
+    остаться захваченной в дочернем процессе. Обработка завершённых
+    заданий (add_done_callback) идёт в отдельных потоках, а не в потоке
+    результатов ProcessPoolExecutor.
+    """
+    
+    # Настройки yt-dlp, нужные постобработчикам в процессе пула
+    PARAMS = ('ffmpeg_location', 'merge_output_format', 'postprocessors', 'audio_format',
+              'postprocessor_args', 'keepvideo', 'overwrites', 'final_ext')
+    
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Args:
+            workers: Количество процессов (по умолчанию - число ядер)
+        """
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self._executor = None
+        self._completions = None
+        self._slots = threading.BoundedSemaphore(2 * self.workers)
+        self._lock = threading.Lock()
+        # Выполненные задания и их суммарное время в процессах
+        self.jobs = 0
+        self.busy = 0.0
+    
+    def submit(self, ydl: yt_dlp.YoutubeDL, filename: str, info: dict,
+               files_to_move: Optional[dict] = None) -> Optional[Future]:
+        """
+        Постановка постобработки загрузки в очередь пула
+        
+        Returns:
+            Future с итоговым путём и временем этапов; None, если
+            постобработка не нужна или info-словарь нельзя передать в процесс
+        """
+        pps = info.get('__postprocessors') or []
+        if not pps and not ydl._pps['post_process']:
+            return None
+        params = {key: ydl.params[key] for key in self.PARAMS if ydl.params.get(key) is not None}
+        params.update(quiet=True, noprogress=True)
+        job = {key: value for key, value in info.items() if key != '__postprocessors'}
+        try:
+            payload = pickle.dumps((params, filename, job, files_to_move or {},
+                                    [type(pp) for pp in pps]))
+        except Exception:
+            return None
+        
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                # Импорт multiprocessing - только когда постобработка действительно нужна
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._completions = ThreadPoolExecutor(max_workers=self.workers,
+                                                       thread_name_prefix='postprocess-done')
+            future = self._executor.submit(_postprocess_job, payload)
+        future.add_done_callback(self._finished)
+        return future
+    
+    def _finished(self, future: Future) -> None:
+        self._slots.release()
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            self.jobs += 1
+            self.busy += sum(future.result()['timings'].values())
+    
+    def add_done_callback(self, future: Future, callback) -> None:
+        """
+        Вызов callback(future) после завершения задания в потоке обработки
+        
+        Хэширование, перенос в хранилище и запись в архив не задерживают
+        получение результатов остальных заданий пула.
+        """
+        future.add_done_callback(lambda done: self._completions.submit(callback, done))
+    
+    def close(self) -> None:
+        """Ожидание оставшихся заданий и остановка процессов"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            completions, self._completions = self._completions, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if completions is not None:
+            completions.shutdown(wait=True)
+
+
+# Классы ошибок загрузки и их описания для вывода
+ERROR_CLASSES = {
+    'transient': 'временная сетевая ошибка',
+    'rate_limited': 'ограничение частоты запросов',
+    'restricted': 'ограничение доступа (регион, возраст, вход)',
+    'gone': 'видео недоступно',
+    'cancelled': 'загрузка отменена',
+    'other': 'прочая ошибка',
+}
+
+# Признаки классов в текстах ошибок yt-dlp (проверяются по порядку)
+_ERROR_PATTERNS = (
+    ('rate_limited', r"\b429\b|too many requests|rate.?limit|confirm you.?re not a bot"),
+    ('restricted', r"not available in your country|geo.?restrict|confirm your age|"
+                   r"age.?restrict|members.?only|private video|sign in to|login required"),
+    ('gone', r"video unavailable|has been removed|no longer available|does not exist|"
+             r"terminated|\b404\b|\b410\b|unsupported url|not a valid url"),
+    ('transient', r"\b403\b|\b5\d\d\b|timed? ?out|connection|reset by peer|temporar|"
+                  r"incomplete|bytes, expected|unable to download|network|ssl"),
+)
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Класс ошибки загрузки: transient, rate_limited, restricted, gone,
+    cancelled или other
+
+    Сначала проверяются типы исключений по всей цепочке причин
+    (DownloadError.exc_info, ExtractorError.cause), затем тексты сообщений.
+    """
+    load_yt_dlp()
+    chain, stack = [], [error]
+    while stack:
+        current = stack.pop()
+        if current is None or any(current is seen for seen in chain):
+            continue
+        chain.append(current)
+        exc_info = getattr(current, 'exc_info', None)
+        stack += [exc_info[1] if exc_info else None, getattr(current, 'cause', None),
+                  current.__cause__, current.__context__]
+    
+    for current in chain:
+        if isinstance(current, SlowDownloadError):
+            return 'transient'
+        if isinstance(current, yt_dlp.utils.DownloadCancelled):
+            return 'cancelled'
+        if isinstance(current, yt_dlp.utils.GeoRestrictedError):
+            return 'restricted'
+        if isinstance(current, yt_dlp.networking.exceptions.HTTPError):
+            status = current.status
+            if status == 429:
+                return 'rate_limited'
+            if status == 401:
+                return 'restricted'
+            if status in (404, 410):
+                return 'gone'
+            if status in (403, 408) or status >= 500:
+                return 'transient'
+        if isinstance(current, (yt_dlp.networking.exceptions.TransportError,
+                                yt_dlp.utils.ContentTooShortError)):
+            return 'transient'
+    
+    message = ' '.join(str(current) for current in chain).lower()
+    for error_class, pattern in _ERROR_PATTERNS:
+        if re.search(pattern, message):
+            return error_class
+    return 'other'
+
+
+class RetryScheduler:
+    """
+    Отложенные повторы неудачных загрузок с экспоненциальной задержкой
+    
+    Повторяются только временные ошибки и ограничения частоты запросов
+    (для них начальная задержка больше). Задержка удваивается с каждой
+    попыткой и случайно сдвигается (jitter), чтобы повторы разных URL не
+    приходили на хост одновременно. Повторы ждут в очереди, а не в потоке
+    загрузки, поэтому остальные загрузки продолжаются.
+    """
+    
+    BASE_DELAY = {'transient': 5.0, 'rate_limited': 30.0}
+    
+    def __init__(self, max_attempts: int = 3, max_delay: float = 600.0):
+        self.max_attempts = max(1, max_attempts)
+        self.max_delay = max_delay
+        self._heap: List[Tuple[float, int, tuple]] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+    
+    def schedule(self, item: tuple, error_class: Optional[str], attempt: int) -> Optional[float]:
+        """
+        Постановка повтора после неудачной попытки attempt
+        
+        Returns:
+            Задержка в секундах или None, если повторять не нужно
+        """
+        base = self.BASE_DELAY.get(error_class)
+        if base is None or attempt >= self.max_attempts:
+            return None
+        delay = min(self.max_delay, base * 2 ** (attempt - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), item))
+        return delay
+    
+    def due(self) -> List[tuple]:
+        """Повторы, время которых наступило"""
+        now = time.monotonic()
+        items = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                items.append(heapq.heappop(self._heap)[2])
+        return items
+    
+    def next_delay(self) -> Optional[float]:
+        """Время до ближайшего повтора в секундах"""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+
+class FailureLog:
+    """
+    Неудачные URL в формате JSON lines: url, класс ошибки, текст, число
+    попыток и время. Файл можно снова передать в --file.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+    
+    def add(self, url: str, result: DownloadResult, attempts: int) -> None:
+        record = {
+            'url': url, 'class': result.error_class, 'error': result.error,
+            'attempts': attempts, 'time': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self.count += 1
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Выбор аудиоформата для целевого кодека: подходящий поток сохраняется
+# без перекодирования (-c copy), остальные перекодируются
+AUDIO_FORMATS = {
+    'best': 'bestaudio/best',
+    'm4a': 'bestaudio[ext=m4a]/bestaudio/best',
+    'opus': 'bestaudio[acodec=opus]/bestaudio/best',
+    'vorbis': 'bestaudio[acodec=vorbis]/bestaudio/best',
+    'mp3': 'bestaudio[acodec=mp3]/bestaudio/best',
+}
 
 
 class YouTubeDownloader:
     """Класс для скачивания видео с YouTube и других платформ"""
     
-    def __init__(self):
+    # Плоское ленивое извлечение плейлистов: только список записей, по страницам
+    EXPAND_OPTS = {'quiet': True, 'extract_flat': 'in_playlist', 'lazy_playlist': True}
+    
+    def __init__(self, metadata_cache: Optional[MetadataCache] = None,
+                 archive: Optional[DownloadArchive] = None, connections: int = 1,
+                 pipeline: str = 'off', progress: Optional[ProgressReporter] = None,
+                 metrics: Optional[DownloadMetrics] = None,
+                 bandwidth: Optional[BandwidthStore] = None,
+                 adaptive: Optional[AdaptiveFormatSelector] = None,
+                 postprocess: Optional[PostprocessPool] = None,
+                 embed_thumbnail: bool = False, audio_format: str = 'mp3',
+                 store: Optional[ContentStore] = None):
+        """
+        Args:
+            metadata_cache: Кэш метаданных видео
+            archive: Архив завершённых загрузок
+            connections: Количество соединений на один файл
+            pipeline: Загрузка видео и аудио для слияния: 'off' - по очереди,
+                'parallel' - одновременно, 'stream' - сразу в ffmpeg
+            progress: Вывод прогресса загрузок
+            metrics: Сбор метрик по этапам загрузки
+            bandwidth: Учёт измеренной скорости загрузки по хостам
+            adaptive: Адаптивный выбор формата по скорости и ограничениям
+            postprocess: Пул процессов для постобработки в пакетной загрузке
+            embed_thumbnail: Встраивать обложку видео в файл
+            audio_format: Кодек файлов при загрузке только аудио; 'best' -
+                исходный поток без перекодирования (см. AUDIO_FORMATS)
+            store: Общее хранилище файлов; в папки загрузок попадают ссылки
+        """
+        self.ffmpeg = FFmpegCache(str(DATA_DIR / 'ffmpeg.json'))
         self.ffmpeg_path = self._find_ffmpeg()
+        self.progress = progress or ProgressReporter()
+        self.metrics = metrics or DownloadMetrics()
+        # Загрузка, выполняемая текущим потоком (для хуков постобработки)
+        self._local = threading.local()
+        self.connections = max(1, connections)
+        self.pipeline = pipeline
+        self.metadata_cache = metadata_cache
+        self.archive = archive
+        self.bandwidth = bandwidth
+        self.adaptive = adaptive
+        self.postprocess = postprocess
+        self.embed_thumbnail = embed_thumbnail
+        self.audio_format = audio_format
+        self.store = store
+        # Свободные экземпляры YoutubeDL по наборам настроек:
+        # ключ -> [(ydl, исходные шаблоны имён)]
+        self._sessions: Dict[tuple, List[Tuple[yt_dlp.YoutubeDL, dict]]] = {}
+        self._session_lock = threading.Lock()
+        # Имена файлов, занятые текущими загрузками: путь -> ключ видео
+        self._claimed_paths: Dict[str, str] = {}
+        self._claim_lock = threading.Lock()
         
     def _find_ffmpeg(self) -> Optional[str]:
-        """Автоматический поиск ffmpeg в системе"""
-        # Проверяем стандартные пути
-        possible_paths = [
-            'C:\\ProgramData\\chocolatey\\bin\\ffmpeg.exe',
-            'C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe',
-            'C:\\ffmpeg\\bin\\ffmpeg.exe'
-        ]
-        
-        # Проверяем ffmpeg в PATH
-        ffmpeg_path = shutil.which('ffmpeg')
+        """Автоматический поиск ffmpeg в системе (PATH и стандартные пути, с кэшем на диске)"""
+        ffmpeg_path = self.ffmpeg.find()
         if ffmpeg_path:
             return ffmpeg_path
-            
-        # Проверяем стандартные пути
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
-                
+        
         print("⚠️  Предупреждение: ffmpeg не найден. Некоторые видео могут не объединиться.")
         return None
     
-    def _progress_hook(self, d):
-        """Hook для отображения прогресса загрузки"""
-        if d['status'] == 'downloading':
-            if 'total_bytes' in d:
-                percent = d['downloaded_bytes'] / d['total_bytes'] * 100
-                print(f"\r📥 Загрузка: {percent:.1f}% ({d['downloaded_bytes']} / {d['total_bytes']} байт)", end='')
-            elif '_percent_str' in d:
-                print(f"\r📥 Загрузка: {d['_percent_str']}", end='')
-        elif d['status'] == 'finished':
-            print(f"\n✅ Загрузка завершена: {d['filename']}")
-    
+    def _postprocessor_timer(self, d: dict) -> None:
+        """Учёт времени слияния и прочей постобработки текущей загрузки"""
+        result = getattr(self._local, 'result', None)
+        if result is None or d['status'] == 'processing':
+            return
+        if d['status'] == 'started':
+            self._local.pp_started = time.perf_counter()
+            return
+        phase = 'merge' if d.get('postprocessor') == 'Merger' else 'postprocess'
+        elapsed = time.perf_counter() - getattr(self._local, 'pp_started', time.perf_counter())
+        result.timings[phase] = result.timings.get(phase, 0.0) + elapsed
+
+    @contextmanager
+    def _session(self, key: tuple, ydl_opts: dict,
+                 result: Optional[DownloadResult] = None) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Выдача «тёплого» экземпляра YoutubeDL для набора настроек key
+        
+        Экземпляр используется одним потоком за раз и после работы
+        возвращается в пул: экстракторы с кэшем player JS / функций подписи,
+        cookies и пул HTTP-соединений переживают отдельные загрузки.
+        """
+        with self._session_lock:
+            idle = self._sessions.get(key)
+            entry = idle.pop() if idle else None
+        if entry is None:
+            started = time.perf_counter()
+            load_yt_dlp()
+            ydl = FastYoutubeDL(ydl_opts)
+            self.ffmpeg.seed(ydl)
+            entry = (ydl, dict(ydl.params['outtmpl']))
+            if result is not None:
+                result.timings['session'] = time.perf_counter() - started
+        elif result is not None:
+            result.session_reused = True
+        try:
+            yield entry[0]
+        finally:
+            # Шаблон имени мог быть изменён для разрешения совпадений
+            entry[0].params['outtmpl'] = dict(entry[1])
+            entry[0].cancel_event = None
+            entry[0].deadline = None
+            entry[0].postprocess_pool = None
+            entry[0].pending_postprocess = None
+            entry[0].format_selector = entry[0].default_format_selector
+            with self._session_lock:
+                self._sessions.setdefault(key, []).append(entry)
+
+    def close_sessions(self) -> None:
+        """Закрытие всех сохранённых экземпляров YoutubeDL"""
+        with self._session_lock:
+            sessions, self._sessions = self._sessions, {}
+        for idle in sessions.values():
+            for ydl, _ in idle:
+                ydl.close()
+
+    def _extract_info(self, ydl, video_url: str,
+                      use_cache: bool = True) -> Tuple[Optional[dict], bool]:
+        """
+        Извлечение info-словаря с использованием кэша метаданных
+        
+        Returns:
+            (info, взят ли результат из кэша)
+        """
+        key = video_key(video_url) if self.metadata_cache else None
+        if key and use_cache:
+            info = self.metadata_cache.get(key)
+            if info:
+                return info, True
+        
+        info = ydl.extract_info(video_url, download=False)
+        if key and info and info.get('_type', 'video') == 'video':
+            self.metadata_cache.put(key, ydl.sanitize_info(info, remove_private_keys=True))
+        return info, False
+
+    def expand_url(self, url: str, entry_filter: Optional[EntryFilter] = None,
+                   stats: Optional[dict] = None) -> Iterator[str]:
+        """
+        Потоковое разворачивание плейлиста или канала в URL отдельных видео
+
+        Используется «плоское» извлечение без обработки: записи выдаются по
+        мере загрузки страниц плейлиста, а подробные метаданные каждого
+        видео извлекаются уже при его скачивании. Фильтр применяется к
+        полям из списка; после последней позиции диапазона разворачивание
+        прекращается, и следующие страницы не запрашиваются.
+
+        Args:
+            url: URL плейлиста или канала
+            entry_filter: Отбор видео до извлечения
+            stats: Словарь статистики, в котором считается 'filtered'
+        """
+        entry_filter = entry_filter or EntryFilter()
+        position = 0
+
+        def nested(entry: dict, entry_url: str) -> bool:
+            # Экстрактор записи обычно известен - без перебора всех экстракторов
+            if entry.get('ie_key'):
+                ie = yt_dlp.extractor.get_info_extractor(entry['ie_key'])
+                return ie.is_single_video(entry_url) is not True
+            return is_playlist_url(entry_url)
+
+        def walk(ydl, info: dict) -> Iterator[dict]:
+            for entry in info.get('entries') or []:
+                if not entry:
+                    continue
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if entry.get('_type') == 'playlist':
+                    yield from walk(ydl, entry)
+                elif entry_url and entry.get('_type') == 'url' and nested(entry, entry_url):
+                    # Вкладки канала и вложенные плейлисты
+                    inner = ydl.extract_info(entry_url, download=False, process=False) or {}
+                    if inner.get('_type', 'video') == 'video':
+                        yield entry
+                    else:
+                        yield from walk(ydl, inner)
+                elif entry_url:
+                    yield entry
+
+        with self._session(('expand',), self.EXPAND_OPTS) as ydl:
+            info = ydl.extract_info(url, download=False, process=False) or {}
+            if info.get('_type', 'video') == 'video':
+                yield url
+                return
+            print(f"\n📜 Плейлист: {info.get('title') or url}")
+            for entry in walk(ydl, info):
+                position += 1
+                if position < entry_filter.first:
+                    continue
+                if entry_filter.last is not None and position > entry_filter.last:
+                    return
+                reason = entry_filter.rejects(entry)
+                if reason:
+                    if stats is not None:
+                        stats['filtered'] = stats.get('filtered', 0) + 1
+                    print(f"🔎 Пропуск {entry.get('title') or entry.get('id')}: {reason}")
+                    continue
+                yield entry.get('url') or entry['webpage_url']
+
     def get_video_info(self, video_url: str) -> Optional[dict]:
-        """Получение информации о видео без загрузки"""
+        """
+        Получение информации о видео без загрузки
+
+        Для плейлистов и каналов запрашивается только первая страница:
+        записи в 'entries' разворачиваются лениво при обходе.
+        """
         try:
+            if is_playlist_url(video_url):
+                with self._session(('expand',), self.EXPAND_OPTS) as ydl:
+                    return ydl.extract_info(video_url, download=False, process=False)
             ydl_opts = {'quiet': True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                return ydl.extract_info(video_url, download=False)
+            with self._session(('info',), ydl_opts) as ydl:
+                return self._extract_info(ydl, video_url)[0]
         except Exception as e:
             print(f"❌ Ошибка получения информации о видео: {str(e)}")
             return None
 
+    def _build_ydl_opts(self, output_dir: Optional[str], quality: str,
+                        audio_only: bool) -> dict:
+        """Формирование настроек yt-dlp для загрузки"""
+        ydl_opts = {
+            'outtmpl': os.path.join(output_dir or '', OUTTMPL),
+            'progress_hooks': [self.progress.hook],
+            'postprocessor_hooks': [self.progress.postprocessor_hook, self._postprocessor_timer],
+            'noprogress': True,
+            'continuedl': True,
+            # По умолчанию в API yt-dlp обрыв соединения сразу считается ошибкой
+            'retries': 10,
+            'fragment_retries': 10,
+            'postprocessors': [],
+        }
+        
+        # Настройка качества и формата
+        if audio_only:
+            ydl_opts['format'] = AUDIO_FORMATS[self.audio_format]
+        else:
+            if quality == 'best':
+                ydl_opts['format'] = 'bestvideo[ext=mp4][height<=?2160]+bestaudio[ext=m4a]/bestvideo+bestaudio/best'
+            elif quality == 'worst':
+                ydl_opts['format'] = 'worst'
+            elif quality in ['144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p']:
+                height = quality[:-1]
+                ydl_opts['format'] = f'bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={height}]+bestaudio/best[height<={height}]'
+            else:
+                ydl_opts['format'] = quality
+            
+            ydl_opts['merge_output_format'] = 'mp4'
+            if self.pipeline == 'parallel' or (self.pipeline == 'stream' and self.ffmpeg_path):
+                ydl_opts['stream_pipeline'] = self.pipeline
+        
+        # Несколько соединений: диапазоны для HTTP, фрагменты для DASH/HLS
+        if self.connections > 1:
+            ydl_opts['segment_connections'] = self.connections
+            ydl_opts['concurrent_fragment_downloads'] = self.connections
+        
+        # Путь к ffmpeg если найден
+        if self.ffmpeg_path:
+            ydl_opts['ffmpeg_location'] = self.ffmpeg_path
+        
+        # Постобработка: извлечение аудио и обложка (нужен ffmpeg)
+        if self.ffmpeg_path and audio_only:
+            ydl_opts['audio_format'] = self.audio_format
+        if self.ffmpeg_path and self.embed_thumbnail:
+            ydl_opts['writethumbnail'] = True
+            ydl_opts['postprocessors'].append({'key': 'EmbedThumbnail'})
+        
+        return ydl_opts
+
+    def _print_video_info(self, info: dict) -> None:
+        """Вывод названия, автора и длительности видео"""
+        title = info.get('title', 'Неизвестно')
+        duration = info.get('duration') or 0
+        uploader = info.get('uploader', 'Неизвестно')
+        
+        print(f"\n📺 Название: {title}")
+        print(f"👤 Автор: {uploader}")
+        if duration:
+            minutes = int(duration) // 60
+            seconds = int(duration) % 60
+            print(f"⏱️  Длительность: {minutes:02d}:{seconds:02d}")
+
+    @staticmethod
+    def _selected_formats(info: dict) -> List[str]:
+        """Список format_id, выбранных yt-dlp для загрузки"""
+        requested = info.get('requested_formats')
+        if requested:
+            return [f['format_id'] for f in requested if f.get('format_id')]
+        return [info['format_id']] if info.get('format_id') else []
+
+    @staticmethod
+    def _downloaded_path(ydl, info: dict) -> Optional[str]:
+        """Итоговый путь к файлу после загрузки и постобработки"""
+        for download in info.get('requested_downloads') or []:
+            if download.get('filepath'):
+                return download['filepath']
+        if info.get('_type', 'video') == 'video':
+            return ydl.prepare_filename(info)
+        return None
+
+    @staticmethod
+    def _downloaded_audio(info: dict) -> dict:
+        """Данные извлечения аудио (AudioExtractPP) из info-словаря загрузки"""
+        for download in info.get('requested_downloads') or [info]:
+            if download.get('audio_path'):
+                return {key: download[key] for key in AUDIO_KEYS if key in download}
+        return {}
+
+    @staticmethod
+    def _record_audio(result: DownloadResult, audio: dict) -> None:
+        if not audio.get('audio_path'):
+            return
+        result.audio_path = audio['audio_path']
+        result.audio_duration = audio.get('audio_duration') or 0.0
+        result.timings['audio'] = audio.get('audio_seconds', 0.0)
+
+    def _claim_output_path(self, ydl, info: dict, output_dir: Optional[str], key: str) -> None:
+        """
+        Резервирование имени файла за видео (key - см. _info_key)
+        
+        Если имя уже заняло другое видео пакета или в папке есть чужой файл
+        с тем же именем (см. _path_taken), к имени добавляется ID видео (у
+        Generic - хэш URL), чтобы загрузки не перезаписывали и не выдавали
+        за свои файлы других видео.
+        """
+        if info.get('_type', 'video') != 'video' or not info.get('id'):
+            return
+        path = os.path.abspath(ydl.prepare_filename(info))
+        with self._claim_lock:
+            if self._claimed_paths.get(path, key) == key and not self._path_taken(path, key):
+                self._claimed_paths[path] = key
+                return
+            # Имя с ID видео принадлежит только ему - существующий файл с таким
+            # именем считается загруженным этим же видео
+            template = OUTTMPL_UNIQUE.replace('%(id)s', self._key_id(key).replace('%', '%%'))
+            ydl.params['outtmpl']['default'] = os.path.join(output_dir or '', template)
+            self._claimed_paths[os.path.abspath(ydl.prepare_filename(info))] = key
+    
+    def _path_taken(self, path: str, key: str) -> bool:
+        """
+        Есть ли на диске файл другого видео с тем же именем
+        
+        Проверяются итоговые файлы с любым расширением (после слияния или
+        извлечения аудио оно меняется); .part и .ytdl не учитываются - их
+        дозагружает yt-dlp. Файл свободен для видео, только если архив или
+        хранилище связывают его с этим же ключом.
+        """
+        base = os.path.splitext(path)[0]
+        for existing in glob.glob(glob.escape(base) + '.*'):
+            ext = existing[len(base) + 1:]
+            if '.' in ext or ext in ('part', 'ytdl'):
+                continue
+            owners = set()
+            if self.archive:
+                owners |= self.archive.keys_for(existing)
+            if self.store:
+                owners |= self.store.keys_for(existing)
+            if key not in {owner.rsplit('/', 1)[0] for owner in owners}:
+                return True
+        return False
+
+    @staticmethod
+    def _info_key(info: dict, video_url: str) -> str:
+        """
+        Ключ видео для архива и хранилища по info-словарю
+        
+        ID у Generic - только имя файла из URL (разные ссылки .../7.mp4
+        совпадут), поэтому такие видео идентифицируются нормализованным URL.
+        """
+        if info.get('extractor_key') == 'Generic':
+            return normalize_url(video_url)[1]
+        return f"{info.get('extractor_key')}:{info.get('id')}"
+
+    @staticmethod
+    def _key_id(key: str) -> str:
+        """ID видео для имени файла: часть ключа после экстрактора или хэш URL (Generic)"""
+        if '://' in key:
+            return hashlib.sha1(key.encode()).hexdigest()[:11]
+        return key.split(':', 1)[-1]
+
+    def _release_claims(self, result: DownloadResult) -> None:
+        """
+        Освобождение имён файлов видео после успешной загрузки или пропуска
+        
+        Зарезервированы только имена текущих загрузок: готовый файл занимает
+        имя на диске (см. _path_taken), а память не растёт с длиной списка.
+        Имя неудачной загрузки остаётся за видео - её .part продолжит повтор,
+        а не другое видео с тем же названием.
+        """
+        if not result.success or not result.key:
+            return
+        with self._claim_lock:
+            for path in [path for path, owner in self._claimed_paths.items() if owner == result.key]:
+                del self._claimed_paths[path]
+
+    def _archive_key(self, key: str, quality: str, audio_only: bool) -> str:
+        """Ключ архива: одно видео в разных режимах (и форматах аудио) хранится отдельно"""
+        return f"{key}/{f'audio-{self.audio_format}' if audio_only else quality}"
+
+    def _find_in_archive(self, key: Optional[str], quality: str, audio_only: bool,
+                         result: DownloadResult) -> bool:
+        """Проверка архива; при совпадении заполняет result как пропущенный"""
+        if not self.archive or not key:
+            return False
+        entry = self.archive.get(self._archive_key(key, quality, audio_only))
+        if not entry:
+            return False
+        print(f"\n⏭️  Уже скачано ранее: {entry['path']}")
+        with self._claim_lock:
+            self._claimed_paths.setdefault(os.path.abspath(entry['path']), key)
+        result.success = True
+        result.skipped = True
+        result.key = key
+        result.filepath = entry['path']
+        result.formats = entry['format'].split('+') if entry['format'] else []
+        return True
+
+    def _find_in_store(self, key: Optional[str], quality: str, audio_only: bool,
+                       output_dir: Optional[str], result: DownloadResult) -> bool:
+        """Проверка хранилища; при совпадении ссылка на файл в папке загрузки"""
+        if not self.store or not key:
+            return False
+        entry = self.store.get(self._archive_key(key, quality, audio_only))
+        if not entry:
+            return False
+        result.filepath = self._link_from_store(entry, key, output_dir)
+        print(f"\n🔗 Уже есть в хранилище: {result.filepath}")
+        result.key = key
+        result.success = True
+        result.skipped = True
+        result.formats = entry['format'].split('+') if entry['format'] else []
+        return True
+
+    def _link_from_store(self, entry: dict, key: str, output_dir: Optional[str]) -> str:
+        """
+        Ссылка на объект хранилища под исходным именем файла
+        
+        Имя, занятое другим файлом или другим видео пакета, дополняется
+        ID видео (и номером); ссылка на тот же объект используется как есть.
+        """
+        stem, ext = os.path.splitext(entry['name'])
+        video_id = self._key_id(key)
+        names = itertools.chain([entry['name'], f"{stem} [{video_id}]{ext}"],
+                                (f"{stem} [{video_id}] ({n}){ext}" for n in itertools.count(1)))
+        with self._claim_lock:
+            for name in names:
+                path = os.path.abspath(os.path.join(output_dir or '', name))
+                if os.path.lexists(path):
+                    if os.path.exists(path) and os.path.samefile(path, entry['path']):
+                        return path
+                    continue
+                if self._claimed_paths.setdefault(path, key) != key:
+                    continue
+                self.store.link(entry['path'], path)
+                return path
+
+    @staticmethod
+    def _drop_invalid_partials(ydl, info: dict) -> None:
+        """
+        Удаление недокачанных .part файлов, которые нельзя продолжить
+        
+        Остальные .part файлы yt-dlp дозагружает с места остановки
+        (continuedl); файл больше ожидаемого размера формата считается
+        повреждённым и скачивается заново.
+        """
+        if info.get('_type', 'video') != 'video':
+            return
+        base = os.path.splitext(ydl.prepare_filename(info))[0]
+        formats = info.get('requested_formats') or [info]
+        for part in glob.glob(glob.escape(base) + '*.part'):
+            name = os.path.basename(part)
+            for fmt in formats:
+                expected = fmt.get('filesize')
+                if len(formats) > 1 and f".f{fmt.get('format_id')}." not in name:
+                    continue
+                if expected and os.path.getsize(part) > expected:
+                    print(f"\n🗑️  Повреждённый частичный файл удалён: {name}")
+                    os.remove(part)
+                    if os.path.exists(part[:-len('.part')] + '.ytdl'):
+                        os.remove(part[:-len('.part')] + '.ytdl')
+                break
+
+    def _process_download(self, ydl, info: dict, video_url: str,
+                          result: DownloadResult) -> dict:
+        """Загрузка по info-словарю; устаревшие данные из кэша извлекаются заново"""
+        try:
+            return ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError:
+            if not result.from_cache:
+                raise
+            # Ссылки на форматы из кэша могли устареть - извлекаем заново
+            print("\n🔄 Данные из кэша устарели, повторное извлечение...")
+            result.retries += 1
+            self.metadata_cache.invalidate(video_key(video_url))
+            info, result.from_cache = self._extract_info(ydl, video_url, use_cache=False)
+            return ydl.process_ie_result(info, download=True)
+
+    def _apply_plan(self, ydl, plan: FormatPlan) -> None:
+        """Загрузка текущего варианта адаптивного выбора со сроком по прогнозу"""
+        option = plan.current
+        ydl.format_selector = ydl.build_format_selector(option['spec'])
+        ydl.deadline = self.adaptive.deadline(plan)
+        ydl.last_speed = None
+        label = f"{option['height']}p" if option['height'] else 'аудио'
+        forecast = ''
+        if plan.bps:
+            forecast = (f", прогноз {option['bytes'] / plan.bps:.0f} с "
+                        f"при {human_size(plan.bps)}/с")
+        print(f"\n🧠 Адаптивный выбор: {label} ({option['spec']}), "
+              f"≈ {human_size(option['bytes'])}{forecast}")
+
+    @staticmethod
+    def _drop_abandoned_partials(ydl, info: dict, spec: str) -> None:
+        """Удаление .part файлов брошенного формата (кроме потоков нового варианта)"""
+        base = glob.escape(os.path.splitext(ydl.prepare_filename(info))[0])
+        keep = [f".f{format_id}." for format_id in spec.split('+')]
+        for path in glob.glob(base + '*.part*') + glob.glob(base + '*.ytdl'):
+            if not any(mark in os.path.basename(path) for mark in keep):
+                os.remove(path)
+
+    def _record_bandwidth(self, result: DownloadResult) -> None:
+        """Учёт скорости завершённой загрузки для адаптивного выбора"""
+        fetch = result.timings.get('fetch', 0.0)
+        if not self.bandwidth or not result.info or not result.bytes or fetch < 1.0:
+            return
+        fmt = (result.info.get('requested_formats') or [result.info])[0]
+        if fmt.get('url'):
+            self.bandwidth.add(BandwidthStore.host(fmt['url']), result.bytes / fetch)
+
     def download_video(self, video_url: str, output_dir: Optional[str] = None, 
-                      quality: str = 'best', audio_only: bool = False) -> bool:
+                      quality: str = 'best', audio_only: bool = False,
+                      dry_run: bool = False,
+                      cancel_event: Optional[threading.Event] = None,
+                      wait_timings: Optional[Dict[str, float]] = None) -> DownloadResult:
         """
         Скачивание одного видео
         
+        Метаданные извлекаются один раз: тот же info-словарь используется
+        и для вывода информации, и для загрузки через process_ie_result.
+        
         Args:
             video_url: URL видео
             output_dir: Папка для сохранения
             quality: Качество видео ('best', 'worst', '720p', '1080p', etc.)
             audio_only: Скачивать только аудио
+            dry_run: Только показать информацию о видео, без загрузки
+            cancel_event: Событие, установка которого прерывает загрузку
+            wait_timings: Время ожидания до начала загрузки ('queue_wait' -
+                в очереди, 'rate_limit' - лимита запросов), с
+        
+        Returns:
+            DownloadResult: info-словарь, выбранные форматы, путь к файлу и
+            время этапов; в логическом контексте равен успешности загрузки
         """
+        result = DownloadResult(url=video_url)
+        result.timings.update(wait_timings or {})
+        # Пакетная загрузка ждёт постобработку через result.pending
+        defer = getattr(self._local, 'defer_postprocess', False) and not dry_run
+        self._local.defer_postprocess = False
+        # Пакетная загрузка учитывает итог в метриках сама: только она знает,
+        # будет ли URL повторён
+        record = not dry_run and not getattr(self._local, 'batch_metrics', False)
+        self._local.batch_metrics = False
+        self._local.result = result
+        self.progress.event('started', phase='extract', url=video_url)
+        # Итог учитывается при любом выходе, кроме ожидания постобработки в пуле
+        report = True
         try:
-            # Настройки загрузчика
-            ydl_opts = {
-                'outtmpl': os.path.join(output_dir or '', '%(title)s.%(ext)s'),
-                'progress_hooks': [self._progress_hook],
-                'extractaudio': audio_only,
-                'audioformat': 'mp3' if audio_only else None,
-            }
-            
-            # Настройка качества и формата
-            if audio_only:
-                ydl_opts['format'] = 'bestaudio/best'
-            else:
-                if quality == 'best':
-                    ydl_opts['format'] = 'bestvideo[ext=mp4][height<=?2160]+bestaudio[ext=m4a]/bestvideo+bestaudio/best'
-                elif quality == 'worst':
-                    ydl_opts['format'] = 'worst'
-                elif quality in ['144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p']:
-                    height = quality[:-1]
-                    ydl_opts['format'] = f'bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={height}]+bestaudio/best[height<={height}]'
-                else:
-                    ydl_opts['format'] = quality
-                
-                ydl_opts['merge_output_format'] = 'mp4'
+            # Проверка хранилища и архива до извлечения метаданных
+            key = normalize_url(video_url)[1]
+            if not dry_run and (
+                    self._find_in_store(key, quality, audio_only, output_dir, result)
+                    or self._find_in_archive(key, quality, audio_only, result)):
+                return result
             
-            # Путь к ffmpeg если найден
-            if self.ffmpeg_path:
-                ydl_opts['ffmpeg_location'] = self.ffmpeg_path
+            ydl_opts = self._build_ydl_opts(output_dir, quality, audio_only)
+            # Папка не входит в ключ: сессии общие для всех папок, шаблон
+            # имени задаётся на время загрузки и восстанавливается _session
+            session_key = ('download', quality, audio_only)
             
-            # Получаем информацию о видео
-            info = self.get_video_info(video_url)
-            if info:
-                title = info.get('title', 'Неизвестно')
-                duration = info.get('duration', 0)
-                uploader = info.get('uploader', 'Неизвестно')
+            with self._session(session_key, ydl_opts, result) as ydl:
+                ydl.params['outtmpl']['default'] = os.path.join(output_dir or '', OUTTMPL)
+                ydl.retry_count = 0
+                ydl.cancel_event = cancel_event
+                ydl.postprocess_pool = self.postprocess if defer else None
+                # Получаем информацию о видео (единственное извлечение)
+                started = time.perf_counter()
+                info, result.from_cache = self._extract_info(ydl, video_url)
+                result.timings['extract'] = time.perf_counter() - started
+                if not info:
+                    raise yt_dlp.utils.DownloadError('не удалось получить информацию о видео')
                 
-                print(f"\n📺 Название: {title}")
-                print(f"👤 Автор: {uploader}")
-                if duration:
-                    minutes = duration // 60
-                    seconds = duration % 60
-                    print(f"⏱️  Длительность: {minutes:02d}:{seconds:02d}")
-            
-            # Скачивание
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([video_url])
+                if result.from_cache:
+                    print("\n💾 Информация о видео взята из кэша")
+                self._print_video_info(info)
+                if dry_run:
+                    result.info = info
+                    result.success = True
+                    return result
+                # Ключ из URL известен не всегда - проверяем ещё раз по ID видео
+                info_key = result.key = self._info_key(info, video_url)
+                if (self._find_in_store(info_key, quality, audio_only, output_dir, result)
+                        or self._find_in_archive(info_key, quality, audio_only, result)):
+                    result.info = info
+                    return result
+                plan = self.adaptive.plan(info, quality, audio_only) if self.adaptive else None
+                if plan:
+                    self._apply_plan(ydl, plan)
+                self._claim_output_path(ydl, info, output_dir, info_key)
+                self._drop_invalid_partials(ydl, info)
                 
-            return True
-            1
+                # Скачивание по уже полученной информации
+                started = time.perf_counter()
+                while True:
+                    try:
+                        info = self._process_download(ydl, info, video_url, result)
+                        break
+                    except SlowDownloadError:
+                        if not plan or not self.adaptive.fallback(plan, ydl.last_speed):
+                            raise
+                        print(f"\n🐢 Загрузка идёт намного медленнее прогноза, "
+                              f"переход на меньший формат")
+                        result.retries += 1
+                        self._drop_abandoned_partials(ydl, info, plan.current['spec'])
+                        self._apply_plan(ydl, plan)
+                result.timings['download'] = time.perf_counter() - started
+                result.timings['fetch'] = max(0.0, result.timings['download']
+                                              - result.timings.get('merge', 0.0)
+                                              - result.timings.get('postprocess', 0.0))
+                result.retries += ydl.retry_count
+                
+                result.info = info
+                result.formats = self._selected_formats(info)
+                result.filepath = self._downloaded_path(ydl, info)
+                self._record_audio(result, self._downloaded_audio(info))
+                pending = ydl.pending_postprocess
+            
+            if pending is not None:
+                report = False
+                self._local.result = None
+                self._await_postprocess(result, pending, info_key, quality, audio_only, record)
+                return result
+            self._store_result(result, info_key, quality, audio_only)
         except Exception as e:
-            print(f"\n❌ Ошибка при скачивании {video_url}: {str(e)}")
-            return False
+            self._fail(result, e)
+        finally:
+            if report:
+                self._local.result = None
+                self._release_claims(result)
+                self._report_result(result, record)
+        return result
+    
+    def _store_result(self, result: DownloadResult, info_key: str, quality: str,
+                      audio_only: bool) -> None:
+        """Размер файла, скорость, перенос в хранилище и запись в архив для завершённой загрузки"""
+        if result.filepath and os.path.isfile(result.filepath):
+            result.bytes = os.path.getsize(result.filepath)
+        self._record_bandwidth(result)
+        if (self.store or self.archive) and result.filepath and os.path.isfile(result.filepath):
+            key = self._archive_key(info_key, quality, audio_only)
+            fmt = '+'.join(result.formats)
+            # Сумма файла считается один раз для хранилища и архива
+            sha256 = file_sha256(result.filepath)
+            if self.store:
+                started = time.perf_counter()
+                self.store.add(key, result.filepath, fmt, sha256)
+                result.timings['store'] = time.perf_counter() - started
+            if self.archive:
+                started = time.perf_counter()
+                self.archive.add(key, result.filepath, fmt, sha256)
+                result.timings['archive'] = time.perf_counter() - started
+        result.success = True
+    
+    @staticmethod
+    def _fail(result: DownloadResult, error: Exception) -> None:
+        result.error = str(error)
+        result.error_class = classify_error(error)
+        print(f"\n❌ Ошибка при скачивании {result.url}: {str(error)}")
+    
+    def _report_result(self, result: DownloadResult, record: bool = True) -> None:
+        """Событие завершения и (если record) учёт результата в метриках"""
+        if record:
+            self._record_metrics(result)
+        # Сбой записи событий не должен прерывать загрузку или пакет
+        try:
+            self.progress.event('done', url=result.url, success=result.success,
+                                skipped=result.skipped, filepath=result.filepath,
+                                error=result.error, timings=result.timings,
+                                bytes=result.bytes, retries=result.retries)
+        except Exception as e:
+            print(f"\n⚠️  Не удалось записать событие загрузки: {str(e)}")
+    
+    def _record_metrics(self, result: DownloadResult, final: bool = True) -> None:
+        """Учёт результата в метриках (см. DownloadMetrics.record)"""
+        # Сбой записи метрик не должен прерывать загрузку или пакет
+        try:
+            self.metrics.record(result, final)
+        except Exception as e:
+            print(f"\n⚠️  Не удалось записать метрики загрузки: {str(e)}")
+    
+    def _await_postprocess(self, result: DownloadResult, pending: Future, info_key: str,
+                           quality: str, audio_only: bool, record: bool = True) -> None:
+        """
+        Завершение загрузки после постобработки в пуле процессов
+        
+        Результат возвращается вызывающему сразу; result.pending
+        завершается, когда файл готов и загрузка учтена в метриках.
+        """
+        result.pending = Future()
+        
+        def finished(future: Future) -> None:
+            try:
+                done = future.result()
+                for phase, elapsed in done['timings'].items():
+                    result.timings[phase] = result.timings.get(phase, 0.0) + elapsed
+                result.filepath = done['filepath'] or result.filepath
+                self._record_audio(result, done['audio'])
+                self._store_result(result, info_key, quality, audio_only)
+            except Exception as e:
+                self._fail(result, e)
+            try:
+                self._release_claims(result)
+                self._report_result(result, record)
+            finally:
+                result.pending.set_result(result)
+        
+        self.postprocess.add_done_callback(pending, finished)
 
     def get_unique_folder(self, base_folder: str) -> str:
         """Создание уникальной папки с номером, если папка уже существует"""
@@ -145,71 +2968,344 @@ class YouTubeDownloader:
             counter += 1
         return folder
 
+    @staticmethod
+    def _count_session(totals: Dict[str, float], result: DownloadResult) -> None:
+        """Учёт создания сессии и времени извлечения одной загрузки пакета"""
+        if result.session_reused:
+            totals['reused'] += 1
+        if 'extract' not in result.timings or result.from_cache:
+            return
+        kind = 'warm' if result.session_reused else 'cold'
+        totals[kind] += 1
+        totals[f'{kind}_extract'] += result.timings['extract']
+        if kind == 'cold':
+            totals['init'] += result.timings.get('session', 0.0)
+
+    @staticmethod
+    def _session_savings(totals: Dict[str, float], stats: dict) -> None:
+        """
+        Оценка времени, сэкономленного повторным использованием сессий
+        
+        Для каждой загрузки в «тёплой» сессии экономия складывается из
+        среднего времени создания YoutubeDL и разницы средних времён
+        извлечения в новых и повторно использованных сессиях.
+        """
+        stats['session_reuses'] = int(totals['reused'])
+        if not totals['reused'] or not totals['cold']:
+            return
+        per_item = totals['init'] / totals['cold']
+        if totals['warm']:
+            per_item += max(0.0, totals['cold_extract'] / totals['cold']
+                            - totals['warm_extract'] / totals['warm'])
+        stats['session_saved'] = per_item * totals['reused']
+
+    def _batch_urls(self, urls: Iterable[str], entry_filter: Optional[EntryFilter],
+                    stats: dict, dedup: UrlDeduplicator) -> Iterator[str]:
+        """
+        URL для загрузки: плейлисты и каналы разворачиваются по мере обхода,
+        повторы отбрасываются и среди входных URL, и среди видео плейлистов
+        """
+        for url in dedup(urls):
+            if not is_playlist_url(url):
+                yield url
+                continue
+            try:
+                yield from dedup(self.expand_url(url, entry_filter, stats))
+            except Exception as e:
+                stats['errors'] += 1
+                stats['error_urls'].append(url)
+                print(f"\n❌ Ошибка разворачивания плейлиста {url}: {str(e)}")
+
+    def download_batch(self, urls: Iterable[str], output_dir: Optional[str],
+                       quality: str = 'best', audio_only: bool = False, jobs: int = 1,
+                       rate_limit: float = 0.5, dry_run: bool = False,
+                       entry_filter: Optional[EntryFilter] = None,
+                       max_attempts: int = 3,
+                       failures_path: Optional[str] = None) -> dict:
+        """
+        Скачивание последовательности URL с итоговой статистикой
+        
+        Плейлисты и каналы разворачиваются потоково: видео попадают в
+        очередь загрузки сразу по мере получения страниц списка, и загрузка
+        первых видео начинается до окончания разворачивания. Повторы одного
+        видео (в разных формах URL или в нескольких плейлистах) отбрасываются
+        до извлечения. Временные ошибки и ограничения частоты запросов
+        повторяются с нарастающей задержкой (RetryScheduler), окончательные
+        неудачи записываются в failures_path.
+        
+        Args:
+            urls: URL видео, плейлистов или каналов
+            output_dir: Папка для сохранения
+            quality: Качество видео
+            audio_only: Скачивать только аудио
+            jobs: Количество одновременных загрузок
+            rate_limit: Максимум новых запросов в секунду к одному хосту
+                (0 - без ограничения)
+            dry_run: Только показать информацию о видео, без загрузки
+            entry_filter: Отбор видео плейлистов до извлечения
+            max_attempts: Попыток на URL при временных ошибках
+            failures_path: Файл неудачных URL (JSON lines)
+        
+        Returns:
+            dict: Статистика загрузки (успешно, ошибки, общее количество)
+        """
+        stats = {'total': 0, 'success': 0, 'skipped': 0, 'filtered': 0, 'duplicates': 0,
+                 'retried': 0, 'errors': 0, 'error_urls': [], 'error_classes': {},
+                 'session_reuses': 0, 'session_saved': 0.0}
+        # Суммы по сессиям вместо списка результатов: память не зависит от длины списка
+        session_totals = dict.fromkeys(('reused', 'cold', 'warm', 'init',
+                                        'cold_extract', 'warm_extract'), 0.0)
+        jobs = max(1, jobs)
+        limiter = RateLimiter(rate_limit, burst=jobs)
+        retry = RetryScheduler(max_attempts)
+        failures = FailureLog(failures_path) if failures_path and not dry_run else None
+        stats_lock = threading.Lock()
+        # Загрузки, ожидающие постобработки в пуле процессов
+        postprocessing = set()
+        # Прерывание пакета (Ctrl+C): текущие загрузки отменяются, новые не начинаются
+        cancel = threading.Event()
+        
+        def worker(i: int, url: str, attempt: int, queued: float) -> None:
+            if cancel.is_set():
+                return
+            queue_wait = time.perf_counter() - queued
+            # Пауза только если запросы к хосту идут чаще лимита
+            waited = limiter.acquire(url)
+            if waited:
+                print(f"\n⏱️  [{i}] Ожидание лимита запросов: {waited:.1f} с")
+            attempt_note = f" (попытка {attempt}/{retry.max_attempts})" if attempt > 1 else ''
+            print(f"\n[{i}/{stats['total']}] 🔗 {url}{attempt_note}")
+            
+            self._local.defer_postprocess = self.postprocess is not None
+            self._local.batch_metrics = True
+            result = self.download_video(url, output_dir, quality, audio_only, dry_run,
+                                         cancel_event=cancel,
+                                         wait_timings={'queue_wait': queue_wait, 'rate_limit': waited})
+            if result.pending is None:
+                report(i, url, attempt, result)
+                return
+            # Постобработка идёт в пуле процессов, поток берёт следующий URL
+            print(f"⚙️  [{i}] Загружено, постобработка в очереди")
+            with stats_lock:
+                postprocessing.add(result.pending)
+            result.pending.add_done_callback(lambda _: report(i, url, attempt, result))
+        
+        def report(i: int, url: str, attempt: int, result: DownloadResult) -> None:
+            with stats_lock:
+                postprocessing.discard(result.pending)
+                self._count_session(session_totals, result)
+                delay = None
+                if not result:
+                    delay = None if dry_run else retry.schedule((i, url, attempt + 1),
+                                                                result.error_class, attempt)
+                if result.skipped:
+                    stats['skipped'] += 1
+                    print(f"⏭️  [{i}] Пропущено (уже скачано)")
+                elif result:
+                    stats['success'] += 1
+                    print(f"✅ [{i}] Успешно!")
+                else:
+                    label = ERROR_CLASSES.get(result.error_class, result.error_class)
+                    if delay is not None:
+                        stats['retried'] += 1
+                        print(f"🔁 [{i}] {label}: повтор через {delay:.0f} с")
+                    else:
+                        stats['errors'] += 1
+                        stats['error_urls'].append(url)
+                        classes = stats['error_classes']
+                        classes[result.error_class] = classes.get(result.error_class, 0) + 1
+                        if failures:
+                            failures.add(url, result, attempt)
+                        print(f"❌ [{i}] Ошибка: {label}")
+            # В метриках итог URL учитывается один раз - по последней попытке
+            if not dry_run:
+                self._record_metrics(result, final=delay is None)
+        
+        # Разворачивание опережает загрузки не более чем на 2 * jobs видео
+        slots = threading.BoundedSemaphore(2 * jobs)
+        pool = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        futures = []
+        
+        def reap() -> None:
+            # Завершённые задания не накапливаются
+            for done in [f for f in futures if f.done()]:
+                futures.remove(done)
+                done.result()
+        
+        def dispatch(i: int, url: str, attempt: int) -> None:
+            if pool is None:
+                worker(i, url, attempt, time.perf_counter())
+                return
+            slots.acquire()
+            future = pool.submit(worker, i, url, attempt, time.perf_counter())
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+            reap()
+        
+        # Скачивание каждого URL по мере разворачивания списка; наступившие
+        # повторы ставятся в очередь между новыми URL
+        dedup = UrlDeduplicator()
+        queue = self._batch_urls(urls, entry_filter, stats, dedup)
+        try:
+            for i, url in enumerate(queue, 1):
+                stats['total'] = i
+                for item in retry.due():
+                    dispatch(*item)
+                dispatch(i, url, 1)
+            # Оставшиеся загрузки и отложенные повторы
+            while True:
+                for item in retry.due():
+                    dispatch(*item)
+                reap()
+                with stats_lock:
+                    busy = bool(futures or postprocessing)
+                if not busy and not len(retry):
+                    break
+                time.sleep(min(0.2 if busy else 1.0, retry.next_delay() or 1.0))
+        except BaseException:
+            cancel.set()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+            if failures:
+                failures.close()
+        
+        self.close_sessions()
+        self._session_savings(session_totals, stats)
+        stats['duplicates'] = dedup.collapsed
+        
+        # Итоговая статистика
+        print("\n" + "="*60)
+        print("📊 ИТОГИ ЗАГРУЗКИ:")
+        print(f"📋 Обработано URL: {stats['total']}")
+        print(f"✅ Успешно загружено: {stats['success']}")
+        if stats['skipped']:
+            print(f"⏭️  Пропущено (уже скачано): {stats['skipped']}")
+        if stats['duplicates']:
+            print(f"🔁 Объединено повторов URL: {stats['duplicates']}")
+        if stats['filtered']:
+            print(f"🔎 Отфильтровано: {stats['filtered']}")
+        if stats['retried']:
+            print(f"🔁 Повторных попыток: {stats['retried']}")
+        print(f"❌ Ошибок: {stats['errors']}")
+        for error_class, count in stats['error_classes'].items():
+            print(f"   • {ERROR_CLASSES.get(error_class, error_class)}: {count}")
+        phases = self.metrics.phase_totals()
+        print(f"⏱️  Этапы: извлечение {phases['extract']:.1f} с, передача {phases['fetch']:.1f} с, "
+              f"слияние {phases['merge']:.1f} с, постобработка {phases['postprocess']:.1f} с, "
+              f"ожидание {phases['queue_wait'] + phases['rate_limit']:.1f} с")
+        audio = self.metrics.audio_totals()
+        if audio['copy']['files']:
+            print(f"🎵 Аудио без перекодирования: {audio['copy']['files']} из "
+                  f"{audio['copy']['files'] + audio['transcode']['files']} файлов, "
+                  f"сэкономлено ≈ {audio['saved_seconds']:.1f} с процессора")
+        if self.metrics.throughput():
+            print(f"🚀 Средняя скорость передачи: {human_size(self.metrics.throughput())}/с")
+        if self.postprocess and self.postprocess.jobs:
+            print(f"⚙️  Постобработка в {self.postprocess.workers} процессах параллельно "
+                  f"с загрузками: {self.postprocess.jobs} файлов, {self.postprocess.busy:.1f} с")
+        if stats['session_reuses']:
+            print(f"♻️  Повторно использовано сессий yt-dlp: {stats['session_reuses']} "
+                  f"(сэкономлено ≈ {stats['session_saved']:.1f} с)")
+        if not dry_run and output_dir:
+            print(f"📁 Папка загрузки: {output_dir}")
+        
+        if stats['error_urls']:
+            print(f"\n❌ URL с ошибками:")
+            for url in stats['error_urls']:
+                print(f"   • {url}")
+        if failures and failures.count:
+            print(f"📝 Неудачные URL записаны в {failures.path} (можно передать в --file)")
+        
+        return stats
+
     def download_from_file(self, file_path: str, quality: str = 'best', 
-                          audio_only: bool = False) -> dict:
+                          audio_only: bool = False, jobs: int = 1,
+                          rate_limit: float = 0.5, dry_run: bool = False,
+                          resume_dir: Optional[str] = None,
+                          entry_filter: Optional[EntryFilter] = None,
+                          follow: bool = False,
+                          follow_timeout: Optional[float] = None,
+                          max_attempts: int = 3,
+                          failures_path: Optional[str] = None) -> dict:
         """
         Скачивание видео из файла со списком URL
         
+        Список читается потоково: загрузка начинается с первой строки, а
+        память не зависит от размера файла.
+        
+        Args:
+            file_path: Путь к файлу с URL ('-' - стандартный ввод)
+            quality: Качество видео
+            audio_only: Скачивать только аудио
+            jobs: Количество одновременных загрузок
+            rate_limit: Максимум новых запросов в секунду к одному хосту
+                (0 - без ограничения)
+            dry_run: Только показать информацию о видео, без загрузки
+            resume_dir: Продолжить загрузку в существующую папку вместо
+                создания новой (недокачанные файлы будут дозагружены)
+            entry_filter: Отбор видео плейлистов и каналов до извлечения
+            follow: Следить за файлом и скачивать дописываемые URL
+            follow_timeout: Завершить слежение, если новых строк нет
+                столько секунд (None - до Ctrl+C)
+            max_attempts: Попыток на URL при временных ошибках
+            failures_path: Файл неудачных URL (по умолчанию failures.jsonl
+                в папке загрузки)
+        
         Returns:
             dict: Статистика загрузки (успешно, ошибки, общее количество)
         """
-        stats = {'total': 0, 'success': 0, 'errors': 0, 'error_urls': []}
+        stats = {'total': 0, 'success': 0, 'skipped': 0, 'filtered': 0, 'duplicates': 0,
+                 'retried': 0, 'errors': 0, 'error_urls': [], 'error_classes': {},
+                 'session_reuses': 0, 'session_saved': 0.0}
         
         try:
-            # Чтение файла
-            with open(file_path, 'r', encoding='utf-8') as file:
-                urls = [line.strip() for line in file if line.strip() and not line.startswith('#')]
-            
-            if not urls:
+            # Список читается построчно по ходу загрузки, а не целиком
+            urls = read_urls(file_path, follow=follow, idle_timeout=follow_timeout)
+            first = next(urls, None)
+            if first is None:
                 print("❌ Файл пуст или содержит только пустые строки.")
                 return stats
             
             # Создание папки для загрузки
-            base_name = Path(file_path).stem
-            date_str = datetime.now().strftime("%y-%m-%d_%H-%M")
-            base_folder = Path(file_path).parent / f"{base_name}_{date_str}"
-            output_dir = self.get_unique_folder(str(base_folder))
-            os.makedirs(output_dir, exist_ok=True)
+            if resume_dir:
+                output_dir = resume_dir
+            else:
+                source = Path('stdin') if file_path == '-' else Path(file_path)
+                date_str = datetime.now().strftime("%y-%m-%d_%H-%M")
+                base_folder = source.parent / f"{source.stem}_{date_str}"
+                output_dir = self.get_unique_folder(str(base_folder))
+            if not dry_run:
+                os.makedirs(output_dir, exist_ok=True)
             
-            print(f"\n📁 Файлы будут сохранены в: {output_dir}")
-            print(f"📋 Найдено {len(urls)} URL-адресов для скачивания.")
+            if dry_run:
+                print("\n🔍 Режим: только информация о видео, без загрузки")
+            elif resume_dir:
+                print(f"\n🔁 Продолжение загрузки в папку: {output_dir}")
+            else:
+                print(f"\n📁 Файлы будут сохранены в: {output_dir}")
+            if self.store and not dry_run:
+                print(f"🗄️  Хранилище: {self.store.root} (в папке - ссылки на файлы)")
+            if file_path == '-':
+                print("📋 URL читаются из стандартного ввода")
+            elif follow:
+                print(f"📋 Слежение за файлом {file_path}: новые URL скачиваются по мере появления")
+            else:
+                print(f"📋 Список URL: {file_path} (читается по ходу загрузки)")
             print(f"🎯 Качество: {quality}")
             if audio_only:
-                print("🎵 Режим: Только аудио (MP3)")
+                print(f"🎵 Режим: Только аудио ({self.audio_format})")
+            if jobs > 1:
+                print(f"⚡ Одновременных загрузок: {jobs}")
             print("-" * 60)
             
-            stats['total'] = len(urls)
-            
-            # Скачивание каждого URL
-            for i, url in enumerate(urls, 1):
-                print(f"\n[{i}/{len(urls)}] 🔗 {url}")
-                
-                success = self.download_video(url, output_dir, quality, audio_only)
-                if success:
-                    stats['success'] += 1
-                    print("✅ Успешно!")
-                else:
-                    stats['errors'] += 1
-                    stats['error_urls'].append(url)
-                    print("❌ Ошибка!")
-                    
-                # Небольшая пауза между загрузками
-                if i < len(urls):
-                    print("⏱️  Пауза 2 секунды...")
-                    import time
-                    time.sleep(2)
-            
-            # Итоговая статистика
-            print("\n" + "="*60)
-            print("📊 ИТОГИ ЗАГРУЗКИ:")
-            print(f"✅ Успешно загружено: {stats['success']}")
-            print(f"❌ Ошибок: {stats['errors']}")
-            print(f"📁 Папка загрузки: {output_dir}")
-            
-            if stats['error_urls']:
-                print(f"\n❌ URL с ошибками:")
-                for url in stats['error_urls']:
-                    print(f"   • {url}")
+            stats = self.download_batch(itertools.chain([first], urls), output_dir,
+                                        quality, audio_only, jobs=jobs,
+                                        rate_limit=rate_limit, dry_run=dry_run,
+                                        entry_filter=entry_filter, max_attempts=max_attempts,
+                                        failures_path=failures_path or os.path.join(
+                                            output_dir, 'failures.jsonl'))
             
         except FileNotFoundError:
             print(f"❌ Файл {file_path} не найден.")
@@ -229,44 +3325,178 @@ def main():
   python download_youtube_folder.py "https://youtube.com/watch?v=..."
   python download_youtube_folder.py --file urls.txt --quality 720p
   python download_youtube_folder.py --file urls.txt --audio-only
+  python download_youtube_folder.py --file urls.txt --jobs 4 --rate-limit 1
+  python download_youtube_folder.py --file urls.txt --resume urls_25-01-01_12-00
+  python download_youtube_folder.py --file urls.txt --store /data/videos-store
+  zcat urls.txt.gz | python download_youtube_folder.py --file - --jobs 4
+  python download_youtube_folder.py --file queue.txt --follow --follow-timeout 600
   python download_youtube_folder.py "https://youtube.com/watch?v=..." --quality 1080p
+  python download_youtube_folder.py "https://youtube.com/watch?v=..." --connections 8
+  python download_youtube_folder.py "https://youtube.com/watch?v=..." --pipeline parallel
+  python download_youtube_folder.py --file urls.txt --quality 1080p --target-time 60 --max-size 500M
+  python download_youtube_folder.py "https://youtube.com/@channel/videos" --date-after now-30days
+  python download_youtube_folder.py "https://youtube.com/playlist?list=..." --items 1-50 --max-duration 600
         """
     )
     
     parser.add_argument('url', nargs='?', help='URL видео для скачивания')
-    parser.add_argument('--file', '-f', type=str, help='Путь к файлу с URL-адресами')
+    parser.add_argument('--file', '-f', type=str,
+                       help='Путь к файлу с URL-адресами (- для чтения из стандартного ввода)')
     parser.add_argument('--quality', '-q', type=str, default='best',
-                       choices=['best', 'worst', '144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p'],
+                       choices=QUALITIES,
                        help='Качество видео (по умолчанию: best)')
     parser.add_argument('--audio-only', '-a', action='store_true',
-                       help='Скачивать только аудио в формате MP3')
+                       help='Скачивать только аудио (формат задаёт --audio-format)')
+    parser.add_argument('--audio-format', type=str, default='mp3', choices=list(AUDIO_FORMATS),
+                       help='Формат для --audio-only: best - исходный поток без перекодирования, '
+                            'm4a/opus/vorbis - копирование потока, если кодек совпадает, иначе '
+                            'перекодирование (по умолчанию: mp3)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                       help='Количество одновременных загрузок из файла или плейлиста (по умолчанию: 1)')
+    parser.add_argument('--connections', '-c', type=int, default=1,
+                       help='Количество соединений для загрузки одного файла (по умолчанию: 1)')
+    parser.add_argument('--pipeline', type=str, default='off', choices=['off', 'parallel', 'stream'],
+                       help='Загрузка видео и аудио перед слиянием: off - по очереди, parallel - одновременно, '
+                            'stream - напрямую в ffmpeg без промежуточных файлов (по умолчанию: off)')
+    parser.add_argument('--pp-workers', type=int, default=None, metavar='N',
+                       help='Процессов постобработки (слияние, MP3, обложка) при загрузке из файла или '
+                            'плейлиста; 0 - в потоке загрузки (по умолчанию: число ядер)')
+    parser.add_argument('--embed-thumbnail', action='store_true',
+                       help='Встраивать обложку видео в файл')
+    parser.add_argument('--rate-limit', type=float, default=0.5,
+                       help='Максимум новых запросов в секунду к одному хосту, 0 - без ограничения (по умолчанию: 0.5)')
+    parser.add_argument('--progress-json', type=str, metavar='PATH',
+                       help='Писать события прогресса в формате JSON lines в файл (- для stderr)')
+    parser.add_argument('--metrics-file', type=str, metavar='PATH',
+                       help='Файл метрик в формате Prometheus (для textfile collector)')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                       help='Отдавать метрики Prometheus по HTTP на 127.0.0.1:PORT/metrics')
+    parser.add_argument('--report-json', type=str, metavar='PATH',
+                       help='Сохранить JSON-отчёт о загрузках по этапам')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Только показать информацию о видео, без загрузки')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Не использовать кэш метаданных')
+    parser.add_argument('--cache-ttl', type=float, default=6,
+                       help='Время жизни записей кэша метаданных в часах (по умолчанию: 6)')
+    parser.add_argument('--resume', type=str, metavar='FOLDER',
+                       help='Продолжить загрузку из файла в существующую папку')
+    parser.add_argument('--no-archive', action='store_true',
+                       help='Не пропускать видео, уже скачанные ранее')
+    parser.add_argument('--store', type=str, nargs='?', const=str(DATA_DIR / 'store'), metavar='DIR',
+                       help='Общее хранилище файлов: каждое видео скачивается и хранится один раз, '
+                            f'в папки загрузок попадают ссылки на него (по умолчанию: {DATA_DIR / "store"})')
+    parser.add_argument('--store-link', type=str, default='hard', choices=ContentStore.LINK_MODES,
+                       help='Ссылки на файлы хранилища: hard - жёсткие (символические, если хранилище '
+                            'на другом диске), symlink - символические (по умолчанию: hard)')
+    parser.add_argument('--target-time', type=float, metavar='SEC',
+                       help='Адаптивный выбор: лучший формат, который по измеренной скорости '
+                            'скачивается за SEC секунд (--quality - верхняя граница)')
+    parser.add_argument('--max-size', type=str, metavar='SIZE',
+                       help='Адаптивный выбор: лучший формат не больше SIZE (например 500M, 2G)')
+    parser.add_argument('--attempts', type=int, default=3,
+                       help='Попыток на URL при временных ошибках и ограничении частоты (по умолчанию: 3)')
+    parser.add_argument('--failures', type=str, metavar='PATH',
+                       help='Файл неудачных URL в формате JSON lines (по умолчанию: failures.jsonl '
+                            'в папке загрузки); его можно передать в --file')
+    parser.add_argument('--follow', action='store_true',
+                       help='Следить за файлом --file и скачивать дописываемые URL (как tail -f)')
+    parser.add_argument('--follow-timeout', type=float, metavar='SEC',
+                       help='Завершить --follow, если новых URL нет SEC секунд (по умолчанию: до Ctrl+C)')
+    parser.add_argument('--date-after', type=str, metavar='DATE',
+                       help='Из плейлистов и каналов - только видео не раньше даты '
+                            '(YYYYMMDD или относительная, например now-30days)')
+    parser.add_argument('--date-before', type=str, metavar='DATE',
+                       help='Из плейлистов и каналов - только видео не позже даты')
+    parser.add_argument('--min-duration', type=float, metavar='SEC',
+                       help='Из плейлистов и каналов - только видео не короче SEC секунд')
+    parser.add_argument('--max-duration', type=float, metavar='SEC',
+                       help='Из плейлистов и каналов - только видео не длиннее SEC секунд')
+    parser.add_argument('--items', type=str, metavar='RANGE',
+                       help='Позиции в плейлисте или канале, например 1-50 или 100- (с 1)')
     
     args = parser.parse_args()
     
+    entry_filter = EntryFilter(min_duration=args.min_duration, max_duration=args.max_duration)
+    try:
+        if args.date_after or args.date_before:
+            entry_filter.dates = yt_dlp.utils.DateRange(args.date_after, args.date_before)
+        if args.items:
+            entry_filter.first, entry_filter.last = EntryFilter.parse_items(args.items)
+        max_bytes = parse_size(args.max_size) if args.max_size else None
+    except ValueError as e:
+        parser.error(str(e))
+    
     print("🎥 YouTube Video Downloader v2.0")
     print("=" * 40)
     print("📦 Используется yt-dlp версии 2025.9.5")
     print()
     
-    downloader = YouTubeDownloader()
+    cache = None
+    if not args.no_cache:
+        cache = MetadataCache(str(DATA_DIR / 'metadata.sqlite3'), ttl=args.cache_ttl * 3600)
+    archive = None
+    if not args.no_archive:
+        archive = DownloadArchive(str(DATA_DIR / 'archive.sqlite3'))
+    store = None
+    if args.store and not args.dry_run:
+        store = ContentStore(args.store, link_mode=args.store_link)
+    bandwidth = BandwidthStore(str(DATA_DIR / 'bandwidth.sqlite3'))
+    adaptive = None
+    if args.target_time or max_bytes:
+        adaptive = AdaptiveFormatSelector(bandwidth, target_time=args.target_time,
+                                          max_bytes=max_bytes)
+    progress = ProgressReporter(events_path=args.progress_json)
+    metrics = DownloadMetrics(textfile_path=args.metrics_file, keep_items=bool(args.report_json))
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    postprocess = None
+    if args.pp_workers != 0 and not args.dry_run:
+        postprocess = PostprocessPool(args.pp_workers)
+    downloader = YouTubeDownloader(metadata_cache=cache, archive=archive,
+                                   connections=args.connections, pipeline=args.pipeline,
+                                   progress=progress, metrics=metrics, bandwidth=bandwidth,
+                                   adaptive=adaptive, postprocess=postprocess,
+                                   embed_thumbnail=args.embed_thumbnail,
+                                   audio_format=args.audio_format, store=store)
+    progress.start()
     
     try:
         if args.file:
             # Скачивание из файла
-            if not os.path.exists(args.file):
+            if args.file != '-' and not os.path.exists(args.file):
                 print(f"❌ Файл {args.file} не существует!")
                 return
+            if args.resume and not os.path.isdir(args.resume):
+                print(f"❌ Папка {args.resume} не существует!")
+                return
             
-            stats = downloader.download_from_file(args.file, args.quality, args.audio_only)
+            stats = downloader.download_from_file(args.file, args.quality, args.audio_only,
+                                                  jobs=args.jobs, rate_limit=args.rate_limit,
+                                                  dry_run=args.dry_run, resume_dir=args.resume,
+                                                  entry_filter=entry_filter, follow=args.follow,
+                                                  follow_timeout=args.follow_timeout,
+                                                  max_attempts=args.attempts,
+                                                  failures_path=args.failures)
             
         elif args.url:
             # Скачивание одного URL
             print(f"🔗 URL: {args.url}")
             print(f"🎯 Качество: {args.quality}")
             if args.audio_only:
-                print("🎵 Режим: Только аудио (MP3)")
+                print(f"🎵 Режим: Только аудио ({args.audio_format})")
+            
+            if is_playlist_url(args.url):
+                # Плейлист или канал: видео скачиваются по мере разворачивания
+                stats = downloader.download_batch([args.url], None, args.quality, args.audio_only,
+                                                  jobs=args.jobs, rate_limit=args.rate_limit,
+                                                  dry_run=args.dry_run, entry_filter=entry_filter,
+                                                  max_attempts=args.attempts,
+                                                  failures_path=args.failures)
+                return
             
-            success = downloader.download_video(args.url, quality=args.quality, audio_only=args.audio_only)
+            success = downloader.download_video(args.url, quality=args.quality, audio_only=args.audio_only,
+                                                dry_run=args.dry_run)
             if success:
                 print("\n✅ Скачивание завершено успешно!")
             else:
@@ -339,8 +3569,27 @@ def main():
     except Exception as e:
         print(f"\n💥 Критическая ошибка: {str(e)}")
     finally:
-        input("\n⏭️  Нажмите Enter для выхода...")
+        if postprocess:
+            postprocess.close()
+        downloader.close_sessions()
+        progress.stop()
+        if args.report_json:
+            metrics.write_report(args.report_json)
+        metrics.close()
+        if cache:
+            cache.close()
+        if archive:
+            archive.close()
+        if store:
+            store.close()
+        bandwidth.close()
+        # Стандартный ввод мог быть источником URL или не быть терминалом
+        if sys.stdin.isatty():
+            input("\n⏭️  Нажмите Enter для выхода...")
 
 
 if __name__ == "__main__":
+    # Процессы постобработки в собранном exe (PyInstaller) запускают этот же файл
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -34,22 +34,29 @@ def download_video(video_url, output_dir=None):
 
 def download_from_file(file_path):
     try:
+        # Файл читается построчно: скачивание начинается сразу, без загрузки всего списка
+        count = 0
+        output_dir = None
         with open(file_path, 'r', encoding='utf-8') as file:
-            urls = [line.strip() for line in file if line.strip()]
-        if not urls:
+            for line in file:
+                url = line.strip()
+                if not url:
+                    continue
+                if output_dir is None:
+                    # Создание папки для загрузки с текущей датой и временем
+                    base_name = os.path.splitext(os.path.basename(file_path))[0]
+                    date_str = datetime.now().strftime("%y-%m-%d %H-%M")
+                    base_folder = os.path.join(os.path.dirname(file_path), f"{base_name}_{date_str}")
+                    output_dir = get_unique_folder(base_folder)
+                    os.makedirs(output_dir, exist_ok=True)
+                    print(f"Файлы будут сохранены в папку: {output_dir}")
+                count += 1
+                print(f"\nСкачивание {count}: {url}")
+                download_video(url, output_dir=output_dir)
+        if not count:
             print("Файл пуст или содержит только пустые строки.")
             return
-        # Создание папки для загрузки с текущей датой и временем
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        date_str = datetime.now().strftime("%y-%m-%d %H-%M")
-        base_folder = os.path.join(os.path.dirname(file_path), f"{base_name}_{date_str}")
-        output_dir = get_unique_folder(base_folder)
-        os.makedirs(output_dir, exist_ok=True)
-        print(f"Файлы будут сохранены в папку: {output_dir}")
-        print(f"Найдено {len(urls)} URL-адресов для скачивания.")
-        for i, url in enumerate(urls, 1):
-            print(f"\nСкачивание {i}/{len(urls)}: {url}")
-            download_video(url, output_dir=output_dir)
+        print(f"\nОбработано {count} URL-адресов.")
     except FileNotFoundError:
         print(f"Файл {file_path} не найден.")
     except Exception as e:
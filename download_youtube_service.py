@@ -0,0 +1,361 @@
+"""
+YouTube Downloader Service
+==========================
+Долгоживущий сервис загрузки на основе YouTubeDownloader
+
+Один процесс держит «тёплые» yt-dlp, кэш метаданных и архив загрузок и
+принимает задания через локальный HTTP API (TCP или Unix-сокет), вместо
+запуска нового интерпретатора на каждое видео. Задания ставятся в очередь
+с приоритетом и выполняются не более чем --jobs одновременно.
+
+API (JSON):
+  POST   /jobs          {"url": ..., "quality": "720p", "audio_only": false,
+                         "output_dir": ..., "priority": 0}  -> задание
+  GET    /jobs          список заданий (?status=queued|running|done|failed|cancelled)
+  GET    /jobs/<id>     состояние задания
+  DELETE /jobs/<id>     отмена задания (в очереди или выполняющегося)
+  GET    /health        состояние сервиса
+  GET    /metrics       метрики в формате Prometheus
+
+Меньшее значение priority выполняется раньше; при равном - по порядку.
+quality - одно из значений --quality загрузчика (best, worst, 144p ... 2160p).
+Завершённые задания хранятся --job-ttl часов, затем удаляются из списка.
+
+Примеры использования:
+  python download_youtube_service.py --port 8765 --jobs 4
+  python download_youtube_service.py --socket /tmp/ytdl.sock --output-dir /data/videos
+  curl -X POST localhost:8765/jobs -d '{"url": "https://youtube.com/watch?v=...", "priority": -1}'
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from download_youtube_folder import (
+    YouTubeDownloader, DownloadResult, DownloadMetrics, DownloadArchive, MetadataCache,
+    ContentStore, ProgressReporter, RateLimiter, DATA_DIR, QUALITIES,
+)
+
+
+@dataclass
+class Job:
+    """Задание на загрузку одного URL"""
+    id: str
+    url: str
+    quality: str = 'best'
+    audio_only: bool = False
+    output_dir: Optional[str] = None
+    priority: int = 0
+    status: str = 'queued'
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[DownloadResult] = None
+    # Ошибка самого задания (не загрузки), например недоступная папка
+    error: Optional[str] = None
+    # ID видео (info-словарь результата не хранится)
+    video_id: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> dict:
+        data = {
+            'id': self.id, 'url': self.url, 'quality': self.quality,
+            'audio_only': self.audio_only, 'output_dir': self.output_dir,
+            'priority': self.priority, 'status': self.status, 'created': self.created,
+            'started': self.started, 'finished': self.finished, 'video_id': self.video_id,
+        }
+        if self.result is not None:
+            data.update({
+                'filepath': self.result.filepath, 'formats': self.result.formats,
+                'skipped': self.result.skipped, 'bytes': self.result.bytes,
+                'error': self.result.error, 'error_class': self.result.error_class,
+                'timings': {k: round(v, 3) for k, v in self.result.timings.items()},
+            })
+        elif self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class DownloadService:
+    """Очередь заданий с приоритетами и ограничением параллельности"""
+
+    REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 409: 'Conflict'}
+
+    # Как часто удаляются устаревшие задания, с
+    EXPIRE_INTERVAL = 60
+
+    def __init__(self, downloader: YouTubeDownloader, output_dir: str, jobs: int = 2,
+                 rate_limit: float = 0.5, job_ttl: float = 3600):
+        """
+        Args:
+            downloader: Загрузчик
+            output_dir: Папка для загрузок по умолчанию
+            jobs: Количество одновременных загрузок
+            rate_limit: Максимум новых запросов в секунду к одному хосту
+            job_ttl: Сколько секунд хранить завершённые задания
+        """
+        self.downloader = downloader
+        self.output_dir = output_dir
+        self.jobs = max(1, jobs)
+        self.job_ttl = job_ttl
+        self._expired = time.time()
+        self.limiter = RateLimiter(rate_limit, burst=self.jobs)
+        self.started = time.time()
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._order = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def submit(self, data: dict) -> Job:
+        """Постановка задания в очередь"""
+        self._expire()
+        url = data.get('url')
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError("поле 'url' обязательно")
+        # Качество - только из списка CLI: от него зависят экземпляры YoutubeDL в пуле
+        quality = data.get('quality', 'best')
+        if quality not in QUALITIES:
+            raise ValueError(f"поле 'quality' должно быть одним из: {', '.join(QUALITIES)}")
+        output_dir = data.get('output_dir') or self.output_dir
+        if not isinstance(output_dir, str):
+            raise ValueError("поле 'output_dir' должно быть строкой")
+        job = Job(id=uuid.uuid4().hex[:12], url=url.strip(), quality=quality,
+                  audio_only=bool(data.get('audio_only', False)),
+                  output_dir=output_dir,
+                  priority=int(data.get('priority', 0)))
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job.priority, next(self._order), job.id))
+        return job
+
+    def _expire(self) -> None:
+        """Удаление завершённых заданий старше job_ttl"""
+        now = time.time()
+        if now - self._expired < self.EXPIRE_INTERVAL:
+            return
+        self._expired = now
+        expired = [job for job in self._jobs.values()
+                   if job.finished is not None and now - job.finished > self.job_ttl]
+        for job in expired:
+            del self._jobs[job.id]
+
+    def cancel(self, job: Job) -> bool:
+        """Отмена задания; False, если оно уже завершено"""
+        if job.status not in ('queued', 'running'):
+            return False
+        job.cancel_event.set()
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished = time.time()
+        return True
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job_id = await self._queue.get()
+            # Отменённое в очереди задание могло быть уже удалено (_expire)
+            job = self._jobs.get(job_id)
+            if job is None or job.status != 'queued':
+                continue
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                await loop.run_in_executor(self._executor, self._run, job)
+            except Exception as e:
+                # Задание завершается с ошибкой, обработчик продолжает работу
+                job.error = str(e)
+                print(f"❌ Ошибка задания {job.id}: {str(e)}")
+            job.finished = time.time()
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+            else:
+                job.status = 'done' if job.result else 'failed'
+
+    def _run(self, job: Job) -> None:
+        """Выполнение задания в потоке пула"""
+        wait_timings = {
+            'queue_wait': job.started - job.created,
+            'rate_limit': self.limiter.acquire(job.url),
+        }
+        os.makedirs(job.output_dir, exist_ok=True)
+        result = self.downloader.download_video(
+            job.url, job.output_dir, job.quality, job.audio_only,
+            cancel_event=job.cancel_event, wait_timings=wait_timings)
+        # Полный info-словарь yt-dlp в памяти сервиса не нужен
+        job.video_id = (result.info or {}).get('id')
+        result.info = None
+        job.result = result
+
+    def handle(self, method: str, target: str, body: bytes) -> Tuple[int, object]:
+        """Обработка запроса API: (код ответа, JSON-объект или текст)"""
+        parsed = urlparse(target)
+        parts = [part for part in parsed.path.split('/') if part]
+
+        if parts == ['health'] and method == 'GET':
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return 200, {'status': 'ok', 'uptime': round(time.time() - self.started, 1),
+                         'workers': self.jobs, 'jobs': counts}
+        if parts == ['metrics'] and method == 'GET':
+            return 200, self.downloader.metrics.to_prometheus()
+        if parts == ['jobs']:
+            if method == 'POST':
+                try:
+                    data = json.loads(body or b'{}')
+                    if not isinstance(data, dict):
+                        raise ValueError('ожидается JSON-объект')
+                    return 201, self.submit(data).to_dict()
+                except (ValueError, TypeError) as e:
+                    return 400, {'error': str(e)}
+            if method == 'GET':
+                status = parse_qs(parsed.query).get('status', [None])[0]
+                return 200, [job.to_dict() for job in self._jobs.values()
+                             if status is None or job.status == status]
+            return 405, {'error': 'метод не поддерживается'}
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self._jobs.get(parts[1])
+            if job is None:
+                return 404, {'error': 'задание не найдено'}
+            if method == 'GET':
+                return 200, job.to_dict()
+            if method == 'DELETE':
+                if not self.cancel(job):
+                    return 409, {'error': f'задание уже завершено ({job.status})'}
+                return 200, job.to_dict()
+            return 405, {'error': 'метод не поддерживается'}
+        return 404, {'error': 'неизвестный путь'}
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Минимальный HTTP/1.1: один запрос на соединение"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length') or 0))
+            if len(request_line) < 2:
+                status, payload = 400, {'error': 'некорректный запрос'}
+            else:
+                status, payload = self.handle(request_line[0].upper(), request_line[1], body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {'error': 'некорректный запрос'}
+
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False).encode(), 'application/json'
+        writer.write(
+            f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765,
+                    socket_path: Optional[str] = None) -> None:
+        self._queue = asyncio.PriorityQueue()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.jobs)]
+        if socket_path:
+            server = await asyncio.start_unix_server(self._client, path=socket_path)
+            print(f"🚀 Сервис слушает {socket_path}")
+        else:
+            server = await asyncio.start_server(self._client, host, port)
+            print(f"🚀 Сервис слушает http://{host}:{port}")
+        print(f"⚡ Одновременных загрузок: {self.jobs}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for job in self._jobs.values():
+                self.cancel(job)
+            for worker in workers:
+                worker.cancel()
+            self._executor.shutdown(wait=True)
+
+
+def main():
+    """Запуск сервиса"""
+    parser = argparse.ArgumentParser(
+        description="YouTube Downloader Service - очередь загрузок с HTTP API",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('API (JSON):')[1],
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Адрес для API (по умолчанию: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Порт API (по умолчанию: 8765)')
+    parser.add_argument('--socket', type=str, metavar='PATH',
+                        help='Слушать Unix-сокет вместо TCP')
+    parser.add_argument('--jobs', '-j', type=int, default=2,
+                        help='Количество одновременных загрузок (по умолчанию: 2)')
+    parser.add_argument('--output-dir', '-o', type=str, default='downloads',
+                        help='Папка для загрузок по умолчанию (по умолчанию: downloads)')
+    parser.add_argument('--connections', '-c', type=int, default=1,
+                        help='Количество соединений для загрузки одного файла (по умолчанию: 1)')
+    parser.add_argument('--pipeline', type=str, default='off', choices=['off', 'parallel', 'stream'],
+                        help='Загрузка видео и аудио перед слиянием (по умолчанию: off)')
+    parser.add_argument('--rate-limit', type=float, default=0.5,
+                        help='Максимум новых запросов в секунду к одному хосту (по умолчанию: 0.5)')
+    parser.add_argument('--progress-json', type=str, metavar='PATH',
+                        help='Писать события прогресса в формате JSON lines в файл (- для stderr)')
+    parser.add_argument('--metrics-file', type=str, metavar='PATH',
+                        help='Файл метрик в формате Prometheus (для textfile collector)')
+    parser.add_argument('--no-cache', action='store_true', help='Не использовать кэш метаданных')
+    parser.add_argument('--no-archive', action='store_true',
+                        help='Не пропускать видео, уже скачанные ранее')
+    parser.add_argument('--job-ttl', type=float, default=1,
+                        help='Сколько часов хранить завершённые задания (по умолчанию: 1)')
+    parser.add_argument('--store', type=str, nargs='?', const=str(DATA_DIR / 'store'), metavar='DIR',
+                        help='Общее хранилище файлов: видео хранится один раз, в папки заданий '
+                             'попадают ссылки на него')
+    parser.add_argument('--store-link', type=str, default='hard', choices=ContentStore.LINK_MODES,
+                        help='Ссылки на файлы хранилища: hard или symlink (по умолчанию: hard)')
+    args = parser.parse_args()
+
+    print("🎥 YouTube Downloader Service")
+    print("=" * 40)
+
+    cache = None if args.no_cache else MetadataCache(str(DATA_DIR / 'metadata.sqlite3'))
+    archive = None if args.no_archive else DownloadArchive(str(DATA_DIR / 'archive.sqlite3'))
+    store = ContentStore(args.store, link_mode=args.store_link) if args.store else None
+    progress = ProgressReporter(events_path=args.progress_json)
+    metrics = DownloadMetrics(textfile_path=args.metrics_file, keep_items=False)
+    downloader = YouTubeDownloader(metadata_cache=cache, archive=archive,
+                                   connections=args.connections, pipeline=args.pipeline,
+                                   progress=progress, metrics=metrics, store=store)
+    service = DownloadService(downloader, args.output_dir, jobs=args.jobs,
+                              rate_limit=args.rate_limit, job_ttl=args.job_ttl * 3600)
+    progress.start()
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        print("\n⚠️  Остановка сервиса...")
+    finally:
+        downloader.close_sessions()
+        progress.stop()
+        metrics.close()
+        if cache:
+            cache.close()
+        if archive:
+            archive.close()
+        if store:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Тесты метрик пакетной загрузки: URL, успешный после повторов, учитывается
+один раз, а неудачные попытки - отдельным счётчиком
+
+Запуск:
+  python -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_youtube_folder as ydf
+from benchmark_download import MockVideoHandler
+
+
+class BatchMetricsTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        with open(os.path.join(cls.media, 'video.mp4'), 'wb') as file:
+            file.write(os.urandom(64 * 1024))
+        MockVideoHandler.root = cls.media
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockVideoHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/progressive/1.mp4'
+        ydf.load_yt_dlp()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.media)
+    
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.metrics = ydf.DownloadMetrics()
+        with mock.patch.object(ydf, 'DATA_DIR', Path(self.work)):
+            self.downloader = ydf.YouTubeDownloader(metrics=self.metrics)
+    
+    def tearDown(self):
+        shutil.rmtree(self.work)
+    
+    def _batch(self, failures: int, max_attempts: int = 3) -> dict:
+        """Пакет из одного URL, первые failures попыток которого падают временной ошибкой"""
+        attempts = []
+        process = ydf.YouTubeDownloader._process_download
+        
+        def flaky(downloader, ydl, info, video_url, result):
+            attempts.append(video_url)
+            if len(attempts) <= failures:
+                raise ydf.yt_dlp.utils.DownloadError('HTTP Error 503: Service Unavailable')
+            return process(downloader, ydl, info, video_url, result)
+        
+        with mock.patch.object(ydf.YouTubeDownloader, '_process_download', flaky), \
+                mock.patch.object(ydf.RetryScheduler, 'BASE_DELAY', {'transient': 0.01}):
+            stats = self.downloader.download_batch(
+                [self.url], os.path.join(self.work, 'out'), rate_limit=0,
+                max_attempts=max_attempts)
+        return stats
+    
+    def test_success_after_retries(self):
+        stats = self._batch(failures=2)
+        self.assertEqual((stats['success'], stats['errors'], stats['retried']), (1, 0, 2))
+        report = self.metrics.report()
+        self.assertEqual(report['downloads'], {'success': 1, 'error': 0, 'skipped': 0})
+        self.assertEqual(report['retried_attempts'], 2)
+        self.assertEqual([item['status'] for item in report['items']], ['success'])
+        self.assertIn('ytdl_retried_attempts_total 2', self.metrics.to_prometheus())
+    
+    def test_final_error(self):
+        stats = self._batch(failures=3, max_attempts=2)
+        self.assertEqual((stats['success'], stats['errors'], stats['retried']), (0, 1, 1))
+        report = self.metrics.report()
+        self.assertEqual(report['downloads'], {'success': 0, 'error': 1, 'skipped': 0})
+        self.assertEqual(report['retried_attempts'], 1)
+        self.assertEqual([item['status'] for item in report['items']], ['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
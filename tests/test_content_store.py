@@ -0,0 +1,86 @@
+"""
+Тесты ContentStore: одинаковое содержимое хранится одним объектом, даже
+если файлы добавляются одновременно
+
+Запуск:
+  python -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_youtube_folder as ydf
+
+
+class ContentStoreTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ydf.ContentStore(os.path.join(self.root, 'store'))
+    
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+    
+    def _file(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+    
+    def _objects(self) -> list:
+        objects = os.path.join(self.store.root, 'objects')
+        return [name for _, _, names in os.walk(objects) for name in names]
+    
+    def test_concurrent_duplicates(self):
+        data = os.urandom(1024)
+        paths = [self._file(f'{i}.mp4', data) for i in range(2)]
+        # Оба потока переносят файл после проверки дубликата и встречаются
+        # перед переименованием; ссылка создаётся медленно, и второй поток
+        # успевает проверить дубликат до того, как первый закончит
+        barrier = threading.Barrier(2)
+        move, link = shutil.move, ydf.ContentStore.link
+        
+        def synced_move(source, target):
+            result = move(source, target)
+            barrier.wait(timeout=5)
+            return result
+        
+        def slow_link(store, source, target):
+            time.sleep(0.2)
+            link(store, source, target)
+        
+        with mock.patch.object(ydf.shutil, 'move', synced_move), \
+                mock.patch.object(ydf.ContentStore, 'link', slow_link):
+            threads = [threading.Thread(target=self.store.add, args=(f'Generic:{i}/best', path, 'mp4'))
+                       for i, path in enumerate(paths)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(self._objects()), 1)
+        for i, path in enumerate(paths):
+            entry = self.store.get(f'Generic:{i}/best')
+            self.assertEqual(entry['path'], self.store.get('Generic:0/best')['path'])
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), data)
+    
+    def test_existing_content(self):
+        data = os.urandom(1024)
+        first = self.store.add('a/best', self._file('a.mp4', data), 'mp4')
+        second = self.store.add('b/best', self._file('b.mp4', data), 'mp4')
+        self.assertEqual(first, second)
+        self.assertEqual(len(self._objects()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Тесты имён файлов загрузок: видео с одинаковым названием не занимают
+файлы друг друга - ни в одном пакете, ни при продолжении в папку с уже
+скачанными файлами
+
+Запуск:
+  python -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_youtube_folder as ydf
+
+
+class OutputNamesTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        ydf.load_yt_dlp()
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.output = os.path.join(self.root, 'out')
+        os.makedirs(self.output)
+        self.archive = ydf.DownloadArchive(os.path.join(self.root, 'archive.sqlite3'))
+        with mock.patch.object(ydf, 'DATA_DIR', Path(self.root)):
+            self.downloader = ydf.YouTubeDownloader(archive=self.archive)
+    
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.root)
+    
+    def _claim(self, key: str) -> str:
+        """Имя файла, которое получит видео 'clip' с ключом key"""
+        ydl = ydf.FastYoutubeDL({'quiet': True,
+                                 'outtmpl': os.path.join(self.output, ydf.OUTTMPL)})
+        info = {'id': 'clip', 'title': 'clip', 'ext': 'mp4', 'extractor_key': 'Generic'}
+        self.downloader._claim_output_path(ydl, info, self.output, key)
+        return os.path.basename(ydl.prepare_filename(info))
+    
+    def _file(self, name: str) -> str:
+        path = os.path.join(self.output, name)
+        with open(path, 'wb') as file:
+            file.write(b'data')
+        return path
+    
+    def test_batch_collision(self):
+        self.assertEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+        self.assertEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+        self.assertNotEqual(self._claim('http://host/clip.mp4?v=2'), 'clip.mp4')
+    
+    def test_existing_file_of_same_video(self):
+        self.archive.add('http://host/clip.mp4/best', self._file('clip.mp4'), 'mp4')
+        self.assertEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+    
+    def test_existing_file_of_other_video(self):
+        self.archive.add('http://host/clip.mp4/best', self._file('clip.mp4'), 'mp4')
+        self.assertNotEqual(self._claim('http://host/clip.mp4?v=2'), 'clip.mp4')
+    
+    def test_existing_file_without_archive(self):
+        self._file('clip.mp4')
+        self.assertNotEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+    
+    def test_existing_file_other_extension(self):
+        # Итоговый файл после извлечения аудио или слияния
+        self._file('clip.mp3')
+        self.assertNotEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+    
+    def test_claims_released(self):
+        # После загрузки имя остаётся занятым только файлом на диске
+        self.assertEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+        result = ydf.DownloadResult(url='http://host/clip.mp4', key='http://host/clip.mp4')
+        self.downloader._release_claims(result)
+        self.assertTrue(self.downloader._claimed_paths)
+        result.success = True
+        self.downloader._release_claims(result)
+        self.assertEqual(self.downloader._claimed_paths, {})
+    
+    def test_partial_file(self):
+        # Недокачанный файл продолжает yt-dlp
+        self._file('clip.mp4.part')
+        self.assertEqual(self._claim('http://host/clip.mp4'), 'clip.mp4')
+
+
+if __name__ == '__main__':
+    unittest.main()
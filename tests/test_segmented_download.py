@@ -0,0 +1,120 @@
+"""
+Тесты SegmentedDownloader: загрузка в несколько соединений и продолжение
+прерванной загрузки на локальном сервере с поддержкой диапазонов
+(тестовый сервер из benchmark_download.py)
+
+Запуск:
+  python -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_youtube_folder as ydf
+from benchmark_download import MockVideoHandler
+
+
+SIZE = 5 * 1024 * 1024
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.source = os.urandom(SIZE)
+        with open(os.path.join(cls.media, 'video.mp4'), 'wb') as file:
+            file.write(cls.source)
+        MockVideoHandler.root = cls.media
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockVideoHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/progressive/1.mp4'
+        ydf.load_yt_dlp()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.media)
+    
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work, 'out.mp4')
+        self.part = self.filename + '.part'
+        self.ydl = ydf.FastYoutubeDL({'quiet': True})
+    
+    def tearDown(self):
+        self.ydl.close()
+        shutil.rmtree(self.work)
+    
+    def _download(self, fail=None) -> list:
+        """
+        Загрузка в 4 соединения; fail(start) -> True прерывает диапазон
+        
+        Returns:
+            Начала скачанных диапазонов
+        """
+        started = []
+        fetch = ydf.SegmentedDownloader._fetch
+        
+        def fetch_or_fail(downloader, url, headers, part, start, end, status):
+            if fail and fail(start):
+                raise OSError('обрыв соединения')
+            started.append(start)
+            fetch(downloader, url, headers, part, start, end, status)
+        
+        downloader = ydf.SegmentedDownloader(self.ydl, connections=4, retries=0)
+        with mock.patch.object(ydf.SegmentedDownloader, '_fetch', fetch_or_fail):
+            self.assertTrue(downloader.download(self.filename, {'url': self.url}))
+        return sorted(started)
+    
+    def _assert_complete(self):
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), self.source)
+        self.assertFalse(os.path.exists(self.part))
+        self.assertFalse(os.path.exists(self.part + '.segments'))
+    
+    def test_download(self):
+        self.assertEqual(len(self._download()), 4)
+        self._assert_complete()
+    
+    def test_resume_after_finished_segments(self):
+        with self.assertRaises(OSError):
+            self._download(fail=lambda start: start > 0)
+        self.assertNotIn(0, self._download())
+        self._assert_complete()
+    
+    def test_resume_before_first_segment(self):
+        # Прерывание сразу после выделения места: .part уже полного размера
+        with self.assertRaises(OSError):
+            self._download(fail=lambda start: True)
+        self.assertEqual(os.path.getsize(self.part), SIZE)
+        self.assertEqual(len(self._download()), 4)
+        self._assert_complete()
+    
+    def test_resume_sequential_part(self):
+        # .part от обычной загрузки yt-dlp: готовые диапазоны не скачиваются
+        with open(self.part, 'wb') as file:
+            file.write(self.source[:3 * 1024 * 1024])
+        self.assertEqual(len(self._download()), 2)
+        self._assert_complete()
+    
+    def test_full_size_part_without_state(self):
+        # .part полного размера без .segments не считается готовым файлом
+        with open(self.part, 'wb') as file:
+            file.truncate(SIZE)
+        self.assertEqual(len(self._download()), 4)
+        self._assert_complete()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Тесты url_extractor: отбор экстракторов по хосту URL должен давать тот же
+экстрактор, что и полный перебор yt-dlp
+
+Запуск:
+  python -m pytest tests
+"""
+
+import itertools
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_youtube_folder as ydf
+
+
+URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ',
+    'https://www.youtube.com/playlist?list=PLx',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLx',
+    'https://cdn.example.com/media/1.mp4',
+    'https://cdn.example.com/media/2.mp4',
+    'http://127.0.0.1:8000/x/7.m4a',
+    'https://vimeo.com/12345',
+    'http://www.rts.ch/archives/tv/divers/3449373-les-enfants-terribles.html',
+    'ytsearch:foo',
+    ':ytfav',
+]
+
+
+def full_scan(url):
+    for ie in ydf.yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            return ie
+    return None
+
+
+class UrlExtractorTest(unittest.TestCase):
+    
+    def assertSameExtractor(self, url):
+        expected = full_scan(url)
+        actual = ydf.url_extractor(url)
+        self.assertIs(actual, expected, f'{url}: {actual} != {expected}')
+    
+    def test_urls(self):
+        for url in URLS:
+            self.assertSameExtractor(url)
+    
+    def test_extractor_testcases(self):
+        # Ссылки из тестов самих экстракторов - по одной на экстрактор
+        for ie in ydf.yt_dlp.extractor.gen_extractor_classes():
+            for case in itertools.islice(ie.get_testcases(include_onlymatching=True), 1):
+                if case.get('url'):
+                    self.assertSameExtractor(case['url'])
+
+
+if __name__ == '__main__':
+    unittest.main()